@@ -1,15 +1,25 @@
 # api_sender.py - REST API Client
 import requests
 import json
+import random
+import time
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any, Optional
 from config import API_CONFIG, SYSTEM_CONFIG, logger
 
+# Gateway/overload responses worth retrying for idempotent requests
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
 class APIClient:
     def __init__(self):
         self.logger = logger
         # Get MAC ID from config
         self.mac_id = SYSTEM_CONFIG['mac_id'] 
-        self.timeout = API_CONFIG['api_timeout']
+        # (connect, read) so a dead host fails fast but a slow response still has time
+        self.timeout = (API_CONFIG.get('connect_timeout', 3.05), API_CONFIG['api_timeout'])
+        self.max_retries = API_CONFIG.get('max_retries', 3)
+        self.backoff_base = API_CONFIG.get('backoff_base', 0.5)
+        self.backoff_max = API_CONFIG.get('backoff_max', 8.0)
         
         # API endpoints
         self.customer_api_url = API_CONFIG['customer_api_url']
@@ -19,35 +29,95 @@ class APIClient:
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         }
+        
+        # Pooled keep-alive session; retries are handled in _post so they can be idempotency aware
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=API_CONFIG.get('pool_maxsize', 4), max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def _is_connect_failure(exc) -> bool:
+        """True when the request never reached the server, so it is safe to resend anything"""
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+            return type(reason).__name__ == 'NewConnectionError'
+        return False
+
+    def _backoff_delay(self, attempt: int, response=None) -> float:
+        """Exponential backoff with full jitter, honouring Retry-After when the server sends it"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _post(self, url: str, payload: Dict[str, Any], idempotent: bool, headers: Optional[Dict[str, str]] = None):
+        """
+        POST with bounded retries.
+        Idempotent requests are retried on any network error and on 429/5xx
+        gateway responses; others only when the connection was never made.
+        """
+        for attempt in range(self.max_retries + 1):
+            retry_response = None
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+                if not (idempotent and response.status_code in RETRY_STATUS_CODES) or attempt == self.max_retries:
+                    return response
+                retry_response = response
+                reason = f"HTTP {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                retryable = idempotent or self._is_connect_failure(e)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                reason = str(e)
+            
+            delay = self._backoff_delay(attempt, retry_response)
+            self.logger.warning(f"POST {url} failed ({reason}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
 
     def fetch_customers(self) -> List[Dict[str, str]]:
         """Fetch customer list from cloud API."""
+        return self.fetch_customers_conditional()['customers']
+
+    def fetch_customers_conditional(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetch customers, sending If-None-Match / If-Modified-Since when validators are known.
+        Returns {'status': 'ok' | 'not_modified' | 'error', 'customers', 'etag', 'last_modified'}.
+        """
         self.logger.info(f"Fetching customers from: {self.customer_api_url}")
         
         payload = {"macId": self.mac_id}
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        result = {'status': 'error', 'customers': [], 'etag': etag, 'last_modified': last_modified}
         
         try:
-            response = requests.post(
-                self.customer_api_url,
-                json=payload,
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            response = self._post(self.customer_api_url, payload, idempotent=True, headers=headers)
             
-            if response.status_code == 200:
+            if response.status_code == 304:
+                result['status'] = 'not_modified'
+            elif response.status_code == 200:
                 try:
                     data = response.json()
-                    return self._parse_customers(data)
+                    result['customers'] = self._parse_customers(data)
+                    result['status'] = 'ok'
+                    result['etag'] = response.headers.get('ETag')
+                    result['last_modified'] = response.headers.get('Last-Modified')
                 except json.JSONDecodeError:
                     self.logger.error("Invalid JSON response from customer API")
-                    return []
             else:
                 self.logger.warning(f"Customer API status {response.status_code}: {response.text}")
-                return []
                 
         except Exception as e:
             self.logger.error(f"Error fetching customers: {e}")
-            return []
+        return result
 
     def _parse_customers(self, data) -> List[Dict[str, str]]:
         """Parse raw API response into standardized list"""
@@ -66,9 +136,13 @@ class APIClient:
                 customers.append({'name': str(c_name), 'id': str(c_id)})
         return customers
 
-    def send_keg_batch(self, keg_ids: List[str], customer_id: str, area_name: str) -> Dict[str, Any]:
+    def send_keg_batch(self, keg_ids: List[str], customer_id: str, area_name: str,
+                       idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         """
         Send the accumulated batch of kegs to the cloud.
+        idempotency_key is sent as the Idempotency-Key header, the same on every
+        attempt of one dispatch. On failure, 'ambiguous' is True when the server
+        may have created the dispatch anyway (read timeout, dropped connection, 5xx).
         Updated Format: 
         {
             "kegIds": [...], 
@@ -86,24 +160,24 @@ class APIClient:
         
         self.logger.info(f"Sending Batch Payload: {json.dumps(payload)}")
         
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
         try:
-            response = requests.post(
-                self.pallet_create_url,
-                json=payload,
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            # Creating a dispatch is not idempotent: only resend if the server never saw it
+            response = self._post(self.pallet_create_url, payload, idempotent=False, headers=headers)
             
             if response.status_code in [200, 201]:
                 self.logger.info("Batch sent successfully")
-                return {'success': True, 'data': response.text}
+                return {'success': True, 'data': response.text, 'status_code': response.status_code}
             else:
                 self.logger.error(f"Batch API Error {response.status_code}: {response.text}")
-                return {'success': False, 'error': response.text}
+                # 503 means the server refused the request; other 5xx may come after it was processed
+                ambiguous = response.status_code >= 500 and response.status_code != 503
+                return {'success': False, 'error': response.text, 'status_code': response.status_code,
+                        'ambiguous': ambiguous}
                 
         except Exception as e:
             self.logger.error(f"Network Exception during batch send: {e}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), 'ambiguous': not self._is_connect_failure(e)}
 
 # Singleton instance
 _api_client_instance = None
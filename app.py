@@ -0,0 +1,191 @@
+# app.py - Top Camera Kivy application (started by main.py)
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from kivy.app import App
+from kivy.clock import Clock
+from config import METRICS_CONFIG, MULTI_CAMERA_CONFIG, PIPELINE_CONFIG, QRCODE_MODEL_PATH, logger
+from camera import TopCameraManager
+from pallet_controller import CustomPalletController
+from detector import KegDetector
+from hmi import ProfessionalTopCameraHMI
+from pipeline import DetectionPipeline
+from mp_pipeline import ProcessDetectionPipeline
+from multi_camera import MultiCameraSystem
+from ws_client import CloudWebSocket  # <--- NEW IMPORT
+from database import get_database
+from metrics import MetricsServer, get_metrics
+from startup import get_startup_timer
+
+class TopCameraApp(App):
+    def build(self):
+        logger.info("Initializing Top Camera Application...")
+        self.startup = get_startup_timer()
+        self.top_camera = None
+        self.controller = None
+        self.pipeline = None
+        self.multi_camera = None
+        
+        # 1. Show the UI straight away in its loading state
+        self.hmi = ProfessionalTopCameraHMI()
+        self.startup.mark('hmi_built')
+        
+        # 2. Open the camera, load the model and open the DB concurrently;
+        #    the startup thread wires them together as each one finishes.
+        #    In process mode the camera and model are opened by their own processes.
+        self._startup_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="Startup")
+        db_future = self._startup_pool.submit(self._open_database)
+        cameras = MULTI_CAMERA_CONFIG.get('cameras') or []
+        if len(cameras) > 1:
+            # One station per camera sharing the model; the HMI shows the first one
+            if PIPELINE_CONFIG.get('mode', 'thread') == 'process':
+                logger.warning("Process pipeline mode is single-camera only; using threads for the camera stations")
+            model_future = self._startup_pool.submit(self._load_model)
+            target, args = self._finish_multi_camera_startup, (cameras, model_future, db_future)
+        elif PIPELINE_CONFIG.get('mode', 'thread') == 'process':
+            target, args = self._finish_process_startup, (db_future,)
+        else:
+            camera_future = self._startup_pool.submit(self._open_camera)
+            model_future = self._startup_pool.submit(self._load_model)
+            target, args = self._finish_startup, (camera_future, model_future, db_future)
+        threading.Thread(target=target, args=args, name="Startup", daemon=True).start()
+        
+        # 3. Initialize WebSocket (Using the logic from ForkliftFrontSystem)
+        self._init_websocket()
+
+        # 4. Optional Prometheus endpoint for the per-stage latency metrics
+        self.metrics_server = None
+        if get_metrics().enabled and METRICS_CONFIG.get('http_enabled', True):
+            self.metrics_server = MetricsServer(get_metrics())
+            self.metrics_server.start()
+        
+        return self.hmi
+
+    def _open_camera(self):
+        top_camera = TopCameraManager()
+        if not top_camera.start():
+            logger.error("Camera failed to start")
+        self.startup.mark('camera_ready')
+        return top_camera
+
+    def _load_model(self):
+        detector = KegDetector(model_path=QRCODE_MODEL_PATH)
+        self.startup.mark('model_loaded')
+        return detector
+
+    def _open_database(self):
+        db = get_database()
+        self.startup.mark('db_ready')
+        return db
+
+    def _finish_startup(self, camera_future, model_future, db_future):
+        """Attach each subsystem as soon as it and its dependencies are ready"""
+        try:
+            # Controller only needs the DB: customers load while camera and model still start
+            self.controller = CustomPalletController(db=db_future.result(), load_detector=False)
+            self.startup.mark('controller_ready')
+            Clock.schedule_once(lambda dt: self.hmi.attach_controller(self.controller), 0)
+            
+            # Live view starts with the camera; frames pass through until the model is attached
+            self.top_camera = camera_future.result()
+            self.pipeline = DetectionPipeline(self.top_camera, self.controller)
+            self.pipeline.start()
+            self.startup.mark('pipeline_started')
+            Clock.schedule_once(lambda dt: self.hmi.attach_pipeline(self.top_camera, self.pipeline), 0)
+            
+            self.controller.attach_detector(model_future.result())
+        except Exception as e:
+            logger.error(f"Startup failed: {e}")
+            message = str(e)
+            Clock.schedule_once(lambda dt: self.hmi.show_startup_error(message), 0)
+        finally:
+            self._startup_pool.shutdown(wait=False)
+
+    def _finish_process_startup(self, db_future):
+        """Process mode: capture and detection run in worker processes over shared memory"""
+        try:
+            self.controller = CustomPalletController(db=db_future.result(), load_detector=False)
+            self.startup.mark('controller_ready')
+            Clock.schedule_once(lambda dt: self.hmi.attach_controller(self.controller), 0)
+            
+            # The pipeline attaches its detection process to the controller once the model is loaded
+            self.pipeline = ProcessDetectionPipeline(self.controller)
+            self.pipeline.start()
+            self.startup.mark('pipeline_started')
+            Clock.schedule_once(lambda dt: self.hmi.attach_pipeline(None, self.pipeline), 0)
+        except Exception as e:
+            logger.error(f"Startup failed: {e}")
+            message = str(e)
+            Clock.schedule_once(lambda dt: self.hmi.show_startup_error(message), 0)
+        finally:
+            self._startup_pool.shutdown(wait=False)
+
+    def _finish_multi_camera_startup(self, cameras, model_future, db_future):
+        """Several cameras: every station gets its own controller and pipeline around one shared model"""
+        try:
+            db_future.result()
+            self.multi_camera = MultiCameraSystem(cameras, detector=model_future.result())
+            self.multi_camera.start()
+            self.startup.mark('pipeline_started')
+            
+            station = self.multi_camera.stations[0]
+            self.controller, self.top_camera, self.pipeline = station.controller, station.camera, station.pipeline
+            logger.info(f"HMI shows camera '{station.name}' of {len(self.multi_camera.stations)}")
+            Clock.schedule_once(lambda dt: self.hmi.attach_controller(self.controller), 0)
+            Clock.schedule_once(lambda dt: self.hmi.attach_pipeline(self.top_camera, self.pipeline), 0)
+        except Exception as e:
+            logger.error(f"Startup failed: {e}")
+            message = str(e)
+            Clock.schedule_once(lambda dt: self.hmi.show_startup_error(message), 0)
+        finally:
+            self._startup_pool.shutdown(wait=False)
+
+    def _init_websocket(self):
+        """Setup the websocket connection and callbacks"""
+        
+        def ws_response(data):
+            """Handle messages FROM Cloud"""
+            try:
+                # 1. Check for location updates
+                if data.get("type") == "location_update" or "location" in data:
+                    new_loc = data.get("location", "Unknown")
+                    logger.info(f"Cloud Popup Trigger: {new_loc}")
+                    
+                    # Trigger the popup on the UI thread
+                    if self.hmi:
+                        self.hmi.on_websocket_message(data)
+
+            except Exception as e:
+                logger.error(f"Error processing WS message: {e}")
+
+        def ws_status_change(status):
+            """Optional: Update UI with connection status"""
+            logger.info(f"WS Status: {status}")
+
+        # Start the client; its messages are delivered on the UI thread by the interval below
+        self.ws_client = CloudWebSocket(
+            on_response=ws_response,
+            on_connection_change=ws_status_change
+        )
+        Clock.schedule_interval(self.ws_client.dispatch_pending, 0.1)
+
+    def on_stop(self):
+        """Cleanup on exit"""
+        logger.info("Application stopping...")
+        multi_camera = getattr(self, 'multi_camera', None)
+        if multi_camera:
+            # Stops every station, the shared model and the shared outbox
+            multi_camera.stop()
+        else:
+            if hasattr(self, 'pipeline') and self.pipeline:
+                self.pipeline.stop()
+            if hasattr(self, 'top_camera') and self.top_camera:
+                self.top_camera.stop()
+            # Unsent dispatches stay in the outbox and resume on next start
+            if hasattr(self, 'controller') and self.controller and self.controller.outbox:
+                self.controller.outbox.stop()
+        if getattr(self, 'metrics_server', None):
+            self.metrics_server.stop()
+        # Commit any queued keg entries before exit
+        get_database().close()
+        if getattr(self, 'ws_client', None):
+            self.ws_client.stop()
@@ -0,0 +1,88 @@
+# backend_parity.py - Check the ONNX backend against the PyTorch backend
+#
+# Runs both backends over the same recorded frames, matches their boxes by
+# IoU and exits non-zero if any box is missing/extra or drifts too far.
+# Also times both backends.
+#
+# Usage:
+#   python3 benchmarks/backend_parity.py --source recording.mp4 --export
+#   python3 benchmarks/backend_parity.py --source frames/ --onnx model/best.onnx
+import argparse
+import time
+
+import numpy as np
+
+from bench_utils import add_source_args, load_frames
+from config import DETECTION_CONFIG, ONNX_MODEL_PATH, QRCODE_MODEL_PATH
+from detector_backends import OnnxBackend, UltralyticsBackend
+from tracker import iou_matrix
+
+
+def timed_predict(backend, frames, conf):
+    backend.predict(frames[:1], conf)  # warm-up
+    results, start = [], time.perf_counter()
+    for frame in frames:
+        results.extend(backend.predict([frame], conf))
+    return results, len(frames) / (time.perf_counter() - start)
+
+
+def compare(reference, candidate, min_iou):
+    """
+    Returns (matched, missing, extra, worst_iou, worst_score_diff).
+    Boxes are paired one-to-one, highest IoU first (as BoxTracker does), so a
+    candidate box can never be counted as the match of two reference boxes.
+    """
+    matched = missing = extra = 0
+    worst_iou, worst_score = 1.0, 0.0
+    for ref, cand in zip(reference, candidate):
+        ious = iou_matrix(ref[:, :4], cand[:, :4])
+        used_ref, used_cand = set(), set()
+        if ious.size:
+            for flat in np.argsort(-ious, axis=None):
+                i, j = divmod(int(flat), ious.shape[1])
+                if ious[i, j] < min_iou:
+                    break
+                if i in used_ref or j in used_cand:
+                    continue
+                used_ref.add(i)
+                used_cand.add(j)
+                worst_iou = min(worst_iou, float(ious[i, j]))
+                worst_score = max(worst_score, abs(float(ref[i, 4] - cand[j, 4])))
+        matched += len(used_ref)
+        missing += len(ref) - len(used_ref)
+        extra += len(cand) - len(used_cand)
+    return matched, missing, extra, worst_iou, worst_score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check: PyTorch vs ONNX detector backend")
+    add_source_args(parser)
+    parser.add_argument('--onnx', default=str(ONNX_MODEL_PATH), help="Exported ONNX model")
+    parser.add_argument('--export', action='store_true', help="Export the ONNX model from --model first")
+    parser.add_argument('--min-iou', type=float, default=0.9)
+    parser.add_argument('--max-score-diff', type=float, default=0.05)
+    args = parser.parse_args()
+
+    pt_path = args.model or str(QRCODE_MODEL_PATH)
+    if args.export:
+        from ultralytics import YOLO
+        args.onnx = YOLO(pt_path).export(format='onnx', imgsz=DETECTION_CONFIG.get('onnx_imgsz', 640))
+
+    frames = load_frames(args.source, args.frames)
+    conf = DETECTION_CONFIG.get('confidence', 0.5)
+
+    torch_results, torch_fps = timed_predict(UltralyticsBackend(pt_path), frames, conf)
+    onnx_results, onnx_fps = timed_predict(OnnxBackend(args.onnx), frames, conf)
+
+    matched, missing, extra, worst_iou, worst_score = compare(torch_results, onnx_results, args.min_iou)
+    print(f"frames: {len(frames)}  boxes matched: {matched}  missing: {missing}  extra: {extra}")
+    print(f"worst IoU: {worst_iou:.3f}  worst score diff: {worst_score:.3f}")
+    print(f"fps  ultralytics: {torch_fps:.1f}  onnx: {onnx_fps:.1f}")
+
+    ok = missing == 0 and extra == 0 and worst_score <= args.max_score_diff
+    print("PARITY OK" if ok else "PARITY FAILED")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
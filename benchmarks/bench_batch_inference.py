@@ -0,0 +1,51 @@
+# bench_batch_inference.py - Throughput/latency of batched YOLO inference
+#
+# Usage: python3 benchmarks/bench_batch_inference.py --source recording.mp4
+import argparse
+import time
+
+from bench_utils import add_source_args, load_frames, percentile
+from detector import KegDetector
+
+
+def run(detector, frames, batch_size, warmup=2):
+    # Warm-up so lazy initialisation is not counted
+    for _ in range(warmup):
+        detector._infer(frames[:batch_size])
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(frames) - batch_size + 1, batch_size):
+        t0 = time.perf_counter()
+        detector._infer(frames[i:i + batch_size])
+        elapsed = time.perf_counter() - t0
+        # Every frame in a batch waits for the whole batch
+        latencies.extend([elapsed] * batch_size)
+    total = time.perf_counter() - start
+
+    return {
+        'fps': len(latencies) / total if total else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare KegDetector batch sizes")
+    add_source_args(parser)
+    parser.add_argument('--batch-sizes', default="1,2,4,8")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    detector = KegDetector(model_path=args.model)
+    if detector.model is None:
+        raise SystemExit("Model failed to load")
+
+    print(f"{'batch':>5} {'fps':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        stats = run(detector, frames, batch_size)
+        print(f"{batch_size:>5} {stats['fps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# bench_decode_chain.py - QR read rate and cost: single zbar pass vs the fallback chain
+#
+# Decodes keg-cap crops once with a plain grayscale zbar pass (the old
+# behaviour) and once with qr_decode.DecodeChain, and prints the share of
+# crops read, time per crop and which strategies won. Without --crops,
+# synthetic crops are generated: QR codes that are small, blurred,
+# rotated and partly washed out by a glare highlight.
+#
+# Usage: python3 benchmarks/bench_decode_chain.py [--crops dir_of_crops] [--count 200]
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from bench_utils import load_frames, percentile
+from qr_decode import DecodeChain, STRATEGIES
+
+
+def synthetic_crops(count, seed=0):
+    rng = np.random.default_rng(seed)
+    encoder = cv2.QRCodeEncoder.create()
+    crops = []
+    for i in range(count):
+        code = encoder.encode(f"KEG{i:06d}")
+        size = int(rng.integers(40, 160))
+        code = cv2.resize(code, (size, size), interpolation=cv2.INTER_AREA)
+        code = cv2.copyMakeBorder(code, 12, 12, 12, 12, cv2.BORDER_CONSTANT, value=255)
+
+        h, w = code.shape
+        rotation = cv2.getRotationMatrix2D((w / 2, h / 2), float(rng.uniform(-30, 30)), 1.0)
+        code = cv2.warpAffine(code, rotation, (w, h), borderValue=255)
+        if rng.random() < 0.5:
+            code = cv2.GaussianBlur(code, (0, 0), float(rng.uniform(0.5, 1.5)))
+
+        # Radial glare highlight over part of the code
+        yy, xx = np.mgrid[0:h, 0:w]
+        cx, cy = rng.uniform(0, w), rng.uniform(0, h)
+        glare = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * (w / 4) ** 2)) * rng.uniform(0, 200)
+        code = np.clip(code.astype(np.float32) * rng.uniform(0.5, 1.0) + glare, 0, 255).astype(np.uint8)
+        crops.append(cv2.cvtColor(code, cv2.COLOR_GRAY2BGR))
+    return crops
+
+
+def run(decode, crops):
+    samples, read = [], 0
+    for crop in crops:
+        t0 = time.perf_counter()
+        ids = decode(crop)
+        samples.append(time.perf_counter() - t0)
+        read += bool(ids)
+    return read, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QR fallback chain read rate")
+    parser.add_argument('--crops', help="Directory of crop images (default: synthetic)")
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--budget-ms', type=float, default=None, help="Per-crop budget (default: config)")
+    args = parser.parse_args()
+
+    crops = load_frames(args.crops, args.count) if args.crops else synthetic_crops(args.count)
+    chain = DecodeChain(budget_ms=args.budget_ms)
+
+    paths = {
+        'gray only (old)': STRATEGIES['gray'],
+        'fallback chain': chain.decode,
+    }
+    print(f"{'path':<18} {'read %':>7} {'mean ms':>8} {'p95 ms':>8}")
+    for name, decode in paths.items():
+        read, samples = run(decode, crops)
+        print(f"{name:<18} {100.0 * read / len(crops):>7.1f} {np.mean(samples) * 1000:>8.2f} "
+              f"{percentile(samples, 95) * 1000:>8.2f}")
+    print(f"Strategy wins: {chain.successes}")
+    print(f"Learned order: {chain.order}")
+
+
+if __name__ == '__main__':
+    main()
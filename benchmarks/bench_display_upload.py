@@ -0,0 +1,68 @@
+# bench_display_upload.py - Per-frame CPU cost of preparing the camera texture upload
+#
+# Compares the old path (full-frame cv2.flip + tobytes, new Texture every
+# frame) with the current one (downscale to the widget, flip via texture
+# coordinates, upload from a memoryview). GL upload time itself is not
+# measured because it needs a window; the new path also uploads far fewer
+# bytes (see the 'upload MB' column).
+#
+# The last two rows include keg annotation: copying and drawing on the
+# full frame in the detector before fitting (old), versus fitting the raw
+# frame and drawing the box overlays at display size (overlay_mode).
+#
+# Usage: python3 benchmarks/bench_display_upload.py --widget 650x366
+import argparse
+import time
+
+import cv2
+
+from bench_utils import load_frames, percentile
+from display import BoxOverlay, as_upload_buffer, draw_overlays, fit_to_size, render_for_display
+
+
+def time_path(frames, prepare, repeat):
+    samples, nbytes = [], 0
+    for _ in range(repeat):
+        for frame in frames:
+            t0 = time.perf_counter()
+            buf = prepare(frame)
+            samples.append(time.perf_counter() - t0)
+            nbytes = len(buf) if isinstance(buf, bytes) else buf.nbytes
+    return samples, nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera texture upload preparation cost")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--widget', default="650x366", help="Camera widget size in pixels")
+    parser.add_argument('--frames', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--boxes', type=int, default=12, help="Keg boxes drawn per frame")
+    args = parser.parse_args()
+
+    widget_w, widget_h = (int(v) for v in args.widget.split('x'))
+    frames = load_frames(None, args.frames, args.width, args.height)
+    # A grid of keg-sized boxes, half with a decoded ID
+    size = args.height // 5
+    overlays = [BoxOverlay((x, y, x + size, y + size), f"KEG{i:05d}" if i % 2 else None)
+                for i, (x, y) in enumerate(((c * size, r * size) for r in range(4) for c in range(8)))][:args.boxes]
+
+    paths = {
+        'flip+tobytes (old)': lambda f: cv2.flip(f, 0).tobytes(),
+        'full-res memoryview': lambda f: as_upload_buffer(f),
+        'fit to widget (new)': lambda f: as_upload_buffer(fit_to_size(f, widget_w, widget_h)),
+        'annotate full + fit': lambda f: as_upload_buffer(
+            fit_to_size(draw_overlays(f.copy(), overlays), widget_w, widget_h)),
+        'fit + overlay (new)': lambda f: as_upload_buffer(render_for_display(f, overlays, widget_w, widget_h)),
+    }
+
+    print(f"{'path':<22} {'p50 ms':>8} {'p95 ms':>8} {'upload MB':>10}")
+    for name, prepare in paths.items():
+        samples, nbytes = time_path(frames, prepare, args.repeat)
+        print(f"{name:<22} {percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 95) * 1000:>8.2f} "
+              f"{nbytes / 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# bench_input_size.py - Speed/accuracy of downscaled YOLO inference
+#
+# Boxes found at full resolution are the reference. For each inference
+# width this reports the network input size it runs at, inference fps, box
+# recall against the reference and how many of the reference QR IDs are
+# still decoded (decoding always uses crops from the full-resolution frame).
+# With --backend onnx the model must be a dynamic-shape export, otherwise
+# every width runs at the export's fixed size.
+#
+# Usage: python3 benchmarks/bench_input_size.py --source recording.mp4 [--backend onnx]
+import argparse
+import time
+
+import numpy as np
+
+from bench_utils import add_source_args, load_frames
+from detector import KegDetector
+from tracker import iou_matrix
+
+
+def run(detector, frames, infer_width):
+    detector.infer_width = infer_width
+    detector.reset_tracking()
+    detector._infer(frames[:1])  # warm-up
+
+    all_boxes, all_ids, infer_time = [], [], 0.0
+    for frame in frames:
+        t0 = time.perf_counter()
+        boxes = detector._infer([frame])[0]
+        infer_time += time.perf_counter() - t0
+        # Decode every box so ID recall does not depend on tracking
+        decoded = detector.decode_executor.decode_all([detector._crop(frame, box) for box in boxes])
+        all_boxes.append(boxes)
+        all_ids.append({qr for ids in decoded for qr in ids})
+    imgsz = detector._model_input_size([detector._downscale(frames[0])[0]])
+    return all_boxes, all_ids, len(frames) / infer_time if infer_time else 0.0, imgsz
+
+
+def box_recall(reference, candidate, iou_threshold=0.5):
+    matched = total = 0
+    for ref_boxes, boxes in zip(reference, candidate):
+        total += len(ref_boxes)
+        if ref_boxes and boxes:
+            ious = iou_matrix(np.asarray(ref_boxes), np.asarray(boxes))
+            matched += int((ious.max(axis=1) >= iou_threshold).sum())
+    return matched / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare KegDetector inference widths")
+    add_source_args(parser)
+    parser.add_argument('--widths', default="1920,1280,960,640,480")
+    parser.add_argument('--backend', help="Detector backend (default: DETECTION_CONFIG['backend'])")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    detector = KegDetector(model_path=args.model, backend=args.backend)
+    if detector.model is None:
+        raise SystemExit("Model failed to load")
+
+    ref_boxes, ref_ids, _, _ = run(detector, frames, None)
+    ref_id_total = sum(len(ids) for ids in ref_ids)
+
+    print(f"{'width':>6} {'imgsz':>6} {'fps':>8} {'box recall':>11} {'id recall':>10}")
+    for width in (int(w) for w in args.widths.split(',')):
+        boxes, ids, fps, imgsz = run(detector, frames, width)
+        id_hits = sum(len(r & c) for r, c in zip(ref_ids, ids))
+        id_recall = id_hits / ref_id_total if ref_id_total else 1.0
+        print(f"{width:>6} {imgsz:>6} {fps:>8.1f} {box_recall(ref_boxes, boxes):>11.3f} {id_recall:>10.3f}")
+
+    detector.decode_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# bench_multi_camera.py - N cameras on one shared model
+#
+# Replays the same footage as N independent cameras through
+# MultiCameraSystem (one KegDetector behind a round-robin BatchedDetector)
+# for a fixed time and prints per-camera capture/detect fps, queue depth
+# and drops, model batch statistics and peak RSS. Run with --cameras 1
+# and --cameras 4 to see how throughput divides and that memory stays at
+# roughly one model.
+#
+# Usage: python3 benchmarks/bench_multi_camera.py --source recording.mp4 --cameras 4 --seconds 20
+import argparse
+import logging
+import resource
+import time
+
+import bench_utils  # noqa: F401  (sets up sys.path)
+from config import MULTI_CAMERA_CONFIG, OUTBOX_CONFIG, TOP_CAMERA_CONFIG, logger
+
+OUTBOX_CONFIG['enabled'] = False
+MULTI_CAMERA_CONFIG['stats_interval'] = 0
+
+from multi_camera import MultiCameraSystem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-camera shared-model benchmark")
+    parser.add_argument('--source', required=True, help="Video file or image directory replayed by every camera")
+    parser.add_argument('--cameras', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--max-speed', action='store_true', help="Do not pace replay at the recorded fps")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    TOP_CAMERA_CONFIG.update(replay_realtime=not args.max_speed, replay_loop=True)
+    cameras = [{'name': f"cam{i}", 'replay_source': args.source} for i in range(args.cameras)]
+
+    system = MultiCameraSystem(cameras)
+    system.start()
+    system.get_stats()
+    time.sleep(args.seconds)
+    stats = system.get_stats()
+    system.stop()
+
+    print(f"{'camera':<8} {'capture fps':>12} {'detect fps':>11} {'queue':>6} {'dropped':>8}")
+    for name, s in stats.items():
+        print(f"{name:<8} {s['capture_fps']:>12.1f} {s['detect_fps']:>11.1f} {s['queue_depth']:>6} {s['frames_dropped']:>8}")
+    engine = system.engine
+    mean_batch = engine.frames_run / engine.batches_run if engine.batches_run else 0.0
+    print(f"Model: {engine.batches_run} batches, {engine.frames_run} frames (mean batch {mean_batch:.2f}, max {engine.batch_size})")
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
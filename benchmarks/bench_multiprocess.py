@@ -0,0 +1,132 @@
+# bench_multiprocess.py - Single-process threads vs capture/detect processes over shared memory
+#
+# Replays the same footage through the threaded DetectionPipeline and through
+# ProcessDetectionPipeline (capture and detection in their own processes,
+# frames in a shared-memory ring) for a fixed time each. A stand-in UI thread
+# polls get_latest() at the HMI's rate and renders every new result at
+# display size, as the Kivy clock does. Prints detect fps, shown fps and
+# end-to-end latency (capture -> result ready, and capture -> rendered).
+#
+# Usage: python3 benchmarks/bench_multiprocess.py --source recording.mp4 [--seconds 20] [--mode both]
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import bench_utils  # noqa: F401  (sets up sys.path)
+from bench_utils import percentile
+from config import OUTBOX_CONFIG, TOP_CAMERA_CONFIG, logger
+
+# Nothing recorded offline should ever be dispatched to the cloud
+OUTBOX_CONFIG['enabled'] = False
+
+from camera import TopCameraManager
+from database import DatabaseManager
+from detector import KegDetector
+from display import render_for_display
+from metrics import get_metrics
+from mp_pipeline import ProcessDetectionPipeline
+from pallet_controller import CustomPalletController
+from pipeline import DetectionPipeline
+
+
+def ui_loop(pipeline, stop, hz, width, height, shown_latency):
+    """Poll the newest result and render it like HMI._update_camera_feed"""
+    last_seq = None
+    while not stop.wait(1.0 / hz):
+        result = pipeline.get_latest()
+        if result is None or result.seq == last_seq:
+            continue
+        last_seq = result.seq
+        render_for_display(result.frame, result.overlays, width, height)
+        shown_latency.append(time.monotonic() - result.captured_at)
+
+
+def run(mode, args, tmp):
+    db = DatabaseManager(os.path.join(tmp, f"{mode}.db"))
+    camera_config = {'replay_source': args.source, 'replay_realtime': not args.max_speed, 'replay_loop': True}
+    if mode == 'thread':
+        controller = CustomPalletController(detector=KegDetector(model_path=args.model, backend=args.backend), db=db)
+        camera = TopCameraManager(camera_config=camera_config)
+        pipeline = DetectionPipeline(camera, controller)
+        camera.start()
+    else:
+        controller = CustomPalletController(db=db, load_detector=False)
+        camera = None
+        pipeline = ProcessDetectionPipeline(controller, camera_config=camera_config,
+                                            model_path=args.model, backend=args.backend)
+    pipeline.start()
+
+    # Measure from the first detected frame, not from process / model start-up
+    deadline = time.monotonic() + 120
+    while controller.detector is None or not pipeline.frames_processed:
+        if time.monotonic() > deadline:
+            pipeline.stop()
+            raise SystemExit(f"{mode}: no detection result within 120s")
+        time.sleep(0.05)
+    time.sleep(1.0)
+
+    stop = threading.Event()
+    shown_latency = []
+    ui = threading.Thread(target=ui_loop, args=(pipeline, stop, args.ui_hz, args.display_width,
+                                                args.display_height, shown_latency), daemon=True)
+    start_processed = pipeline.frames_processed
+    get_metrics().reset()
+    ui.start()
+    time.sleep(args.seconds)
+    stop.set()
+    ui.join()
+
+    processed = pipeline.frames_processed - start_processed
+    ready = get_metrics().snapshot().get('frame_end_to_end', {'p50': 0.0, 'p95': 0.0})
+    pipeline.stop()
+    if camera is not None:
+        camera.stop()
+    ids = controller.get_scanned_list()
+    db.close()
+
+    return {
+        'mode': mode,
+        'detect_fps': processed / args.seconds,
+        'shown_fps': len(shown_latency) / args.seconds,
+        'ready_ms': (ready['p50'] * 1000, ready['p95'] * 1000),
+        'shown_ms': (percentile(shown_latency, 50) * 1000, percentile(shown_latency, 95) * 1000),
+        'ids': len(ids)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded vs multi-process detection pipeline")
+    parser.add_argument('--source', required=True, help="Video file or image directory (replayed in a loop)")
+    parser.add_argument('--model', help="Model path (default: config.QRCODE_MODEL_PATH)")
+    parser.add_argument('--backend', help="Detector backend (default: DETECTION_CONFIG['backend'])")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Measured time per mode")
+    parser.add_argument('--mode', choices=['thread', 'process', 'both'], default='both')
+    parser.add_argument('--max-speed', action='store_true', help="Do not pace replay at the recorded fps")
+    parser.add_argument('--ui-hz', type=float, default=30.0, help="Stand-in UI poll rate")
+    parser.add_argument('--display-width', type=int, default=800)
+    parser.add_argument('--display-height', type=int, default=450)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    get_metrics().enabled = True
+    get_metrics().window = 100000
+    # The shared frame ring is sized from the camera config; size it for the footage instead
+    probe = bench_utils.load_frames(args.source, 1)[0]
+    TOP_CAMERA_CONFIG.update(height=probe.shape[0], width=probe.shape[1])
+
+    modes = ['thread', 'process'] if args.mode == 'both' else [args.mode]
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [run(mode, args, tmp) for mode in modes]
+
+    print(f"{'mode':<8} {'detect fps':>11} {'shown fps':>10} {'ready p50/p95 ms':>18} {'shown p50/p95 ms':>18} {'IDs':>5}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['detect_fps']:>11.1f} {r['shown_fps']:>10.1f} "
+              f"{r['ready_ms'][0]:>8.1f} /{r['ready_ms'][1]:>7.1f} {r['shown_ms'][0]:>8.1f} /{r['shown_ms'][1]:>7.1f} "
+              f"{r['ids']:>5}")
+
+
+if __name__ == '__main__':
+    main()
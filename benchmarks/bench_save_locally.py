@@ -0,0 +1,98 @@
+# bench_save_locally.py - Cost of recording newly scanned kegs over a session
+#
+# Simulates sessions of N kegs where each frame re-detects the kegs still
+# in view plus one new one, and compares the old save_locally() (walk the
+# whole session set for every new keg, one DB call per keg) with the
+# current pending-writes queue (one bulk DB call per frame). Both run
+# against a fresh temporary database, once with the write-behind queue off
+# (every DB call is a commit) and once with it on (DB calls only enqueue).
+#
+# Usage: python3 benchmarks/bench_save_locally.py --sizes 10,100,1000
+import argparse
+import os
+import tempfile
+import time
+
+import logging
+
+import bench_utils  # noqa: F401  (sets up sys.path)
+from config import DB_CONFIG, OUTBOX_CONFIG, logger
+
+OUTBOX_CONFIG['enabled'] = False
+
+from database import DatabaseManager
+from pallet_controller import CustomPalletController
+
+
+class ReplayDetector:
+    """Stands in for KegDetector: returns the IDs scripted for each frame"""
+
+    def __init__(self):
+        self.next_ids = []
+
+    def detect_with_overlays(self, frame):
+        return frame, self.next_ids, []
+
+    def reset_tracking(self):
+        pass
+
+
+def frame_ids(i, in_view, new_per_frame):
+    """IDs decoded in frame i: the last new_per_frame are new, the rest still in view"""
+    last = (i + 1) * new_per_frame
+    return [f"KEG{j:05d}" for j in range(max(0, last - in_view), last)]
+
+
+def legacy_session(db, pallet_id, frames, in_view, new_per_frame):
+    """The pre-queue algorithm: O(n) set walk and one DB call per new keg"""
+    scanned, saved = set(), set()
+    for i in range(frames):
+        for kid in frame_ids(i, in_view, new_per_frame):
+            if kid not in scanned:
+                scanned.add(kid)
+                for s in scanned:
+                    if s not in saved and db.add_keg_entry(pallet_id, "TopCamera", 1, [s]):
+                        saved.add(s)
+
+
+def queued_session(controller, detector, frames, in_view, new_per_frame):
+    for i in range(frames):
+        detector.next_ids = frame_ids(i, in_view, new_per_frame)
+        controller.process_frame(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="save_locally microbenchmark")
+    parser.add_argument('--sizes', default="10,100,1000")
+    parser.add_argument('--in-view', type=int, default=20, help="Kegs visible per frame")
+    parser.add_argument('--new-per-frame', type=int, default=1, help="Kegs first seen per frame (e.g. a new layer)")
+    args = parser.parse_args()
+    k = max(1, args.new_per_frame)
+
+    # Per-keg log lines would dominate both paths
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'write-behind':>12} {'kegs':>6} {'legacy ms':>10} {'queued ms':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for write_behind, n in ((wb, int(v)) for wb in (False, True) for v in args.sizes.split(',')):
+            DB_CONFIG['write_behind'] = write_behind
+            db = DatabaseManager(os.path.join(tmp, f"bench_{write_behind}_{n}.db"))
+            detector = ReplayDetector()
+            controller = CustomPalletController(detector=detector, db=db, api_client=object())
+
+            t0 = time.perf_counter()
+            legacy_session(db, "LEGACY", n // k, args.in_view, k)
+            legacy = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            queued_session(controller, detector, n // k, args.in_view, k)
+            queued = time.perf_counter() - t0
+
+            assert len(db.get_pallet_kegs(controller.current_pallet_id)) == n // k * k
+            db.close()
+            print(f"{'on' if write_behind else 'off':>12} {n:>6} {legacy * 1000:>10.1f} {queued * 1000:>10.1f} "
+                  f"{legacy / queued:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
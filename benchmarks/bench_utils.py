@@ -0,0 +1,57 @@
+# bench_utils.py - Shared helpers for the offline benchmarks
+import sys
+from pathlib import Path
+
+# Make the application modules importable when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_frames(source=None, limit=100, width=1920, height=1080):
+    """
+    Load up to `limit` BGR frames from a video file or an image directory.
+    Without a source, random noise frames of the given size are generated
+    (useful for timing only; they contain no kegs).
+    """
+    frames = []
+    if source is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(limit)]
+
+    path = Path(source)
+    if path.is_dir():
+        for image_path in sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS):
+            frame = cv2.imread(str(image_path))
+            if frame is not None:
+                frames.append(frame)
+            if len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(str(path))
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+
+    if not frames:
+        raise SystemExit(f"No frames could be read from {source}")
+    return frames
+
+
+def percentile(samples, pct):
+    """Percentile of a list of samples (0 when empty)"""
+    if not samples:
+        return 0.0
+    return float(np.percentile(samples, pct))
+
+
+def add_source_args(parser):
+    parser.add_argument('--source', help="Video file or image directory (default: synthetic frames)")
+    parser.add_argument('--frames', type=int, default=64, help="Number of frames to load")
+    parser.add_argument('--model', help="Model path (default: config.QRCODE_MODEL_PATH)")
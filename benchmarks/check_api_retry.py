@@ -0,0 +1,132 @@
+# check_api_retry.py - APIClient connection reuse and retry policy against a local stub server
+#
+# Starts an http.server on localhost that answers with a scripted sequence
+# of status codes, points APIClient at it and checks:
+#   - consecutive requests reuse one keep-alive connection
+#   - fetch_customers (idempotent) retries 503 -> 502 -> 200 and succeeds
+#   - send_keg_batch (not idempotent) does not retry a 503
+#   - send_keg_batch does retry a refused connection (request never sent)
+# Backoff delays are recorded instead of slept. Exits non-zero on failure.
+#
+# Usage: python3 benchmarks/check_api_retry.py
+import json
+import logging
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bench_utils  # noqa: F401  (sets up sys.path)
+from config import API_CONFIG, logger
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client can keep the connection open
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        server.requests.append((self.path, self.client_address[1]))
+        status = server.script.pop(0) if server.script else 200
+        body = json.dumps({'data': [{'customerName': 'Acme', '_id': 'c1'}]} if status == 200 else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.requests, server.script = [], []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_client(port, on_backoff=None):
+    from api_sender import APIClient
+    API_CONFIG.update(customer_api_url=f"http://127.0.0.1:{port}/customers",
+                      pallet_create_url=f"http://127.0.0.1:{port}/dispatch",
+                      max_retries=3, api_timeout=2)
+    client = APIClient()
+    delays = []
+
+    def record_backoff(attempt, response=None):
+        delays.append(attempt)
+        if on_backoff:
+            on_backoff(attempt)
+        return 0.0
+
+    client._backoff_delay = record_backoff
+    return client, delays
+
+
+def check(name, condition, detail):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}: {detail}")
+    return condition
+
+
+def main():
+    logger.setLevel(logging.CRITICAL)
+    results = []
+
+    server = start_server()
+    port = server.server_address[1]
+    client, delays = make_client(port)
+
+    # Connection reuse: several requests, one client port on the server side
+    for _ in range(3):
+        client.fetch_customers()
+    ports = {client_port for _, client_port in server.requests}
+    results.append(check("keep-alive", len(ports) == 1, f"{len(server.requests)} requests over {len(ports)} connection(s)"))
+
+    # Idempotent customer fetch: 503, 502 retried, then 200
+    server.requests.clear()
+    delays.clear()
+    server.script[:] = [503, 502, 200]
+    customers = client.fetch_customers()
+    results.append(check("customers retried", len(server.requests) == 3 and len(delays) == 2 and customers,
+                         f"{len(server.requests)} requests, {len(delays)} retries, {len(customers)} customers"))
+
+    # Dispatch is not idempotent: a 503 is returned, not retried
+    server.requests.clear()
+    delays.clear()
+    server.script[:] = [503]
+    response = client.send_keg_batch(['KEG1'], 'c1', 'Area')
+    results.append(check("batch 503 not retried", len(server.requests) == 1 and not delays and not response['success'],
+                         f"{len(server.requests)} request(s), status {response.get('status_code')}"))
+    server.shutdown()
+    server.server_close()
+
+    # Refused connection: the request never left, so even the dispatch is retried
+    refused_port = free_port()
+    late = {}
+
+    def bring_server_up(attempt):
+        if 'server' not in late:
+            late['server'] = start_server(refused_port)
+
+    client, delays = make_client(refused_port, on_backoff=bring_server_up)
+    response = client.send_keg_batch(['KEG1'], 'c1', 'Area')
+    sent = len(late['server'].requests) if 'server' in late else 0
+    results.append(check("refused connection retried", response['success'] and len(delays) >= 1 and sent == 1,
+                         f"{len(delays)} retries, {sent} request(s) reached the server"))
+    if 'server' in late:
+        late['server'].shutdown()
+        late['server'].server_close()
+
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
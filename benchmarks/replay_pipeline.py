@@ -0,0 +1,131 @@
+# replay_pipeline.py - Headless end-to-end run over recorded footage
+#
+# Feeds a video file or image directory through TopCameraManager (replay
+# source) -> CustomPalletController.process_frame, without Kivy, against a
+# throwaway database. Reports throughput, per-stage latency from metrics.py,
+# the set of keg IDs decoded and the process memory high-water, so models,
+# backends and code changes can be compared on the same footage.
+#
+# By default every frame is processed in order (deterministic, max speed).
+# --pipeline runs the app's DetectionPipeline threads instead, with frame
+# dropping and scene-change scheduling, at real-time pace unless --max-speed.
+#
+# Usage: python3 benchmarks/replay_pipeline.py --source recording.mp4 [--backend onnx] [--json out.json]
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+
+import bench_utils  # noqa: F401  (sets up sys.path)
+from config import OUTBOX_CONFIG, logger
+
+# Nothing recorded offline should ever be dispatched to the cloud
+OUTBOX_CONFIG['enabled'] = False
+
+from camera import TopCameraManager
+from database import DatabaseManager
+from detector import KegDetector
+from metrics import get_metrics
+from pallet_controller import CustomPalletController
+from pipeline import DetectionPipeline
+
+
+def run_sequential(camera, controller, limit):
+    frames = 0
+    while not limit or frames < limit:
+        ret, frame = camera.get_overhead_view()
+        if not ret:
+            break
+        controller.process_frame(frame)
+        frames += 1
+    return frames
+
+
+def run_pipeline(camera, controller, limit):
+    pipeline = DetectionPipeline(camera, controller)
+    camera.start()
+    pipeline.start()
+    try:
+        while not camera.cap.exhausted and (not limit or camera.cap.frames_read < limit):
+            time.sleep(0.05)
+        # Let the detect worker finish the frame it is on
+        time.sleep(max(0.1, pipeline.scheduler.inference_time * 2))
+    finally:
+        pipeline.stop()
+        camera.stop()
+    return pipeline.frames_processed
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the detection pipeline")
+    parser.add_argument('--source', required=True, help="Video file or image directory")
+    parser.add_argument('--model', help="Model path (default: config.QRCODE_MODEL_PATH)")
+    parser.add_argument('--backend', help="Detector backend (default: DETECTION_CONFIG['backend'])")
+    parser.add_argument('--limit', type=int, default=0, help="Stop after this many frames (0 = whole recording)")
+    parser.add_argument('--pipeline', action='store_true', help="Use the threaded DetectionPipeline as the app does")
+    parser.add_argument('--max-speed', action='store_true', help="With --pipeline, do not pace at the recorded fps")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    get_metrics().enabled = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "replay.db"))
+        detector = KegDetector(model_path=args.model, backend=args.backend)
+        controller = CustomPalletController(detector=detector, db=db)
+        camera = TopCameraManager(replay_source=args.source, realtime=args.pipeline and not args.max_speed)
+        replay = camera.cap
+        if not camera.is_active:
+            raise SystemExit(f"Could not open replay source {args.source}")
+
+        start = time.perf_counter()
+        if args.pipeline:
+            frames = run_pipeline(camera, controller, args.limit)
+        else:
+            frames = run_sequential(camera, controller, args.limit)
+        elapsed = time.perf_counter() - start
+
+        controller.save_locally()
+        stored = db.get_pallet_kegs(controller.current_pallet_id)
+        decoded = controller.get_scanned_list()
+        db.close()
+        detector.decode_executor.shutdown()
+
+    report = {
+        'source': args.source,
+        'mode': 'pipeline' if args.pipeline else 'sequential',
+        'frames_read': replay.frames_read,
+        'frames_processed': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'stages_ms': {name: {k: (v * 1000 if k != 'count' else v) for k, v in stats.items()}
+                      for name, stats in get_metrics().snapshot().items()},
+        'ids_decoded': decoded,
+        'ids_stored': len(stored),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+    print(f"{report['frames_processed']} frames processed ({report['frames_read']} read) "
+          f"in {elapsed:.2f}s -> {report['fps']:.1f} fps [{report['mode']}]")
+    print(f"{'stage':<28} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in report['stages_ms'].items():
+        print(f"{name:<28} {stats['count']:>6} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['p99']:>8.2f}")
+    print(f"{len(decoded)} IDs decoded ({report['ids_stored']} stored): {', '.join(decoded)}")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,123 @@ import cv2
 import numpy as np
 import time
 import os
+import threading
+from pathlib import Path
 from config import TOP_CAMERA_CONFIG, logger
+from metrics import get_metrics
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+class ReplayCameraSource:
+    """
+    Plays back a recorded video file or a directory of images through the
+    cv2.VideoCapture interface used by TopCameraManager.
+    realtime=True paces frames at the recording's fps (or `fps` for image
+    directories); otherwise frames are returned as fast as they are read.
+    """
+
+    def __init__(self, source, realtime=True, fps=None, loop=False):
+        self.logger = logger
+        self.source = Path(source)
+        self.realtime = realtime
+        self.loop = loop
+        self.frames_read = 0
+        self.exhausted = False
+        self._video = None
+        self._images = []
+        self._index = 0
+        self._next_due = None
+
+        if self.source.is_dir():
+            self._images = sorted(p for p in self.source.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            self.fps = fps or TOP_CAMERA_CONFIG.get('fps', 30)
+        else:
+            self._video = cv2.VideoCapture(str(self.source))
+            self.fps = fps or self._video.get(cv2.CAP_PROP_FPS) or TOP_CAMERA_CONFIG.get('fps', 30)
+        self.logger.info(f"Replay source {self.source} ({'real-time' if realtime else 'max speed'} @ {self.fps:.1f}fps)")
+
+    def _read_next(self):
+        if self._video is not None:
+            ret, frame = self._video.read()
+            if not ret and self.loop and self.frames_read:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self._video.read()
+            return ret, frame
+
+        if self._index >= len(self._images):
+            if not (self.loop and self._images):
+                return False, None
+            self._index = 0
+        frame = cv2.imread(str(self._images[self._index]))
+        self._index += 1
+        return frame is not None, frame
+
+    def read(self, image=None):
+        if self.exhausted:
+            return False, None
+        ret, frame = self._read_next()
+        if not ret or frame is None:
+            self.exhausted = True
+            self.logger.info(f"Replay finished after {self.frames_read} frames")
+            return False, None
+
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_due is None:
+                self._next_due = now
+            elif self._next_due > now:
+                time.sleep(self._next_due - now)
+            self._next_due = max(self._next_due, now - 1.0 / self.fps) + 1.0 / self.fps
+
+        self.frames_read += 1
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def isOpened(self):
+        return self._video.isOpened() if self._video is not None else bool(self._images)
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+    def set(self, prop, val):
+        pass
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0
+
 
 class TopCameraManager:
     """Manages the ICAM-540 top-mounted camera"""
     
-    def __init__(self):
-        self.config = TOP_CAMERA_CONFIG
+    def __init__(self, replay_source=None, realtime=None, camera_config=None):
+        # camera_config overrides TOP_CAMERA_CONFIG keys for one of several cameras
+        self.config = {**TOP_CAMERA_CONFIG, **(camera_config or {})}
+        self.name = self.config.get('name', 'top')
         self.logger = logger
+        self.replay_source = replay_source or self.config.get('replay_source')
+        self.replay_realtime = self.config.get('replay_realtime', True) if realtime is None else realtime
         self.cap = None
         self.is_active = False
         self.frame_count = 0
         
+        # Grabber thread state (threaded_grab mode)
+        self._ring = []
+        self._ring_seq = []
+        self._ring_ts = []
+        self._latest_seq = 0
+        self._last_consumed_seq = 0
+        self._frame_cond = threading.Condition()
+        self._grab_thread = None
+        self._grab_stop = threading.Event()
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        
         # Initialize based on updated config
         self._initialize_camera()
     
@@ -30,6 +135,10 @@ class TopCameraManager:
 
     def _initialize_camera(self):
         """Initialize the top camera with ICAM-540 specific settings"""
+        if self.replay_source:
+            self._initialize_replay()
+            return
+        
         try:
             device = self.config.get('device', 10)
             width = self.config.get('width', 1920)
@@ -67,6 +176,20 @@ class TopCameraManager:
             self.logger.error(f"Top camera initialization error: {e}")
             self._create_dummy_cap()
     
+    def _initialize_replay(self):
+        """Use recorded footage instead of the device (benchmarks, offline testing)"""
+        try:
+            self.cap = ReplayCameraSource(self.replay_source, realtime=self.replay_realtime,
+                                          loop=self.config.get('replay_loop', False))
+            if not self.cap.isOpened():
+                self.logger.error(f"Replay source could not be opened: {self.replay_source}")
+                self._create_dummy_cap()
+                return
+            self.is_active = True
+        except Exception as e:
+            self.logger.error(f"Replay source initialization error: {e}")
+            self._create_dummy_cap()
+    
     def _create_dummy_cap(self):
         """Create dummy camera for fallback"""
         self.logger.warning("Using DUMMY camera mode.")
@@ -75,7 +198,7 @@ class TopCameraManager:
                 self.manager = manager
                 self.frame_count = 0
             
-            def read(self):
+            def read(self, image=None):
                 self.frame_count += 1
                 # Create black frame matching configured resolution
                 h = self.manager.config.get('height', 1080)
@@ -101,15 +224,150 @@ class TopCameraManager:
         """Start camera capture"""
         if self.cap is None:
             self._initialize_camera()
+        if self.is_active and self.config.get('threaded_grab', False):
+            self.start_grabber()
         return self.is_active
     
-    def get_overhead_view(self):
-        """Get overhead view frame from top camera"""
+    def start_grabber(self):
+        """Start draining the device continuously into a preallocated frame ring"""
+        if self._grab_thread is not None:
+            return
+        
+        ring_size = max(2, int(self.config.get('ring_size', 4)))
+        h = self.config.get('height', 1080)
+        w = self.config.get('width', 1920)
+        self._ring = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(ring_size)]
+        self._ring_seq = [0] * ring_size
+        self._ring_ts = [0.0] * ring_size
+        
+        self._grab_stop.clear()
+        self._grab_thread = threading.Thread(target=self._grab_loop, name="TopCameraGrabber", daemon=True)
+        self._grab_thread.start()
+        self.logger.info(f"Camera grabber thread started (ring of {ring_size} frames)")
+    
+    def stop_grabber(self):
+        """Stop the grabber thread and wait for it to finish its last read"""
+        if self._grab_thread is None:
+            return
+        self._grab_stop.set()
+        self._grab_thread.join(timeout=2.0)
+        self._grab_thread = None
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+    
+    def _grab_loop(self):
+        ring_size = len(self._ring)
+        read_failed = False
+        
+        while not self._grab_stop.is_set():
+            cap = self.cap
+            if cap is None:
+                break
+            
+            seq = self._latest_seq + 1
+            slot = seq % ring_size
+            buf = self._ring[slot]
+            # Mark the slot as being overwritten so a concurrent copy in get_latest() retries
+            with self._frame_cond:
+                self._ring_seq[slot] = -1
+            
+            try:
+                # cv2 decodes straight into buf when shape and dtype match
+                ret, frame = cap.read(buf)
+            except Exception as e:
+                ret, frame = False, None
+                self.logger.error(f"Grabber error reading from top camera: {e}")
+            
+            if not ret or frame is None:
+                if not read_failed:
+                    self.logger.warning("Failed to read frame from top camera")
+                    read_failed = True
+                self._grab_stop.wait(0.01)
+                continue
+            read_failed = False
+            
+            with self._frame_cond:
+                if frame is not buf:
+                    # Device delivered a different resolution than configured; adopt it
+                    if frame.shape == buf.shape:
+                        np.copyto(buf, frame)
+                    else:
+                        self._ring[slot] = frame
+                self._ring_seq[slot] = seq
+                self._ring_ts[slot] = time.monotonic()
+                self._latest_seq = seq
+                self.frames_captured += 1
+                self._frame_cond.notify_all()
+    
+    def get_latest(self, copy=True, max_attempts=3):
+        """
+        Returns (ok, frame, seq, timestamp) for the newest grabbed frame.
+        seq increases by one per captured frame and timestamp is time.monotonic()
+        at capture, so consumers can tell whether they are looking at fresh data.
+        A copy the grabber overwrote mid-way is retried up to max_attempts times,
+        then (False, None, seq, timestamp) is returned rather than a torn frame.
+        """
+        for _ in range(max(1, max_attempts)):
+            with self._frame_cond:
+                seq = self._latest_seq
+                if seq == 0:
+                    return False, None, 0, 0.0
+                slot = seq % len(self._ring)
+                frame = self._ring[slot]
+                timestamp = self._ring_ts[slot]
+                
+                # Frames the consumer never saw count as dropped
+                if seq > self._last_consumed_seq:
+                    if self._last_consumed_seq:
+                        self.frames_dropped += seq - self._last_consumed_seq - 1
+                    self._last_consumed_seq = seq
+            
+            if not copy:
+                return True, frame, seq, timestamp
+            frame = frame.copy()
+            # The grabber may have lapped the ring while we copied
+            with self._frame_cond:
+                if self._ring_seq[slot] == seq:
+                    return True, frame, seq, timestamp
+        
+        self.logger.warning(f"Camera ring lapped {max_attempts} times while copying frame {seq}")
+        return False, None, seq, timestamp
+    
+    def get_stats(self):
+        """Frame counters for the grabber thread"""
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'latest_seq': self._latest_seq
+        }
+    
+    def _wait_for_new_frame(self, timeout=1.0):
+        with self._frame_cond:
+            return self._frame_cond.wait_for(
+                lambda: self._latest_seq > self._last_consumed_seq or self._grab_stop.is_set(),
+                timeout=timeout
+            )
+    
+    def get_overhead_view(self, image=None):
+        """Get overhead view frame from top camera (read straight into `image` when its size matches)"""
+        with get_metrics().timer('camera_get_overhead_view'):
+            return self._read_overhead_view(image)
+
+    def _read_overhead_view(self, image=None):
         if self.cap is None:
             self._initialize_camera()
         
+        if self._grab_thread is not None:
+            # Threaded mode: hand out the newest grabbed frame instead of the next queued one
+            if not self._wait_for_new_frame():
+                return False, None
+            ret, frame, _, _ = self.get_latest()
+            if ret:
+                self.frame_count += 1
+            return ret, frame
+        
         try:
-            ret, frame = self.cap.read()
+            ret, frame = self.cap.read() if image is None else self.cap.read(image)
             if not ret or frame is None:
                 self.logger.warning("Failed to read frame from top camera")
                 return False, None
@@ -123,6 +381,7 @@ class TopCameraManager:
     
     def stop(self):
         """Stop camera capture"""
+        self.stop_grabber()
         if self.cap and hasattr(self.cap, 'release'):
             self.cap.release()
         self.cap = None
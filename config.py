@@ -15,8 +15,16 @@ SAVE_FOLDER.mkdir(exist_ok=True)
 # ========== DATABASE CONFIGURATION ==========
 DB_CONFIG = {
     'timeout': 10.0,
+    'journal_mode': 'WAL',      # Readers do not block the writer
+    'synchronous': 'NORMAL',    # No fsync per commit in WAL mode (still crash safe)
+    'write_behind': True,       # Queue keg inserts and commit them in batches
+    'flush_interval_ms': 200,   # How often the write-behind queue is committed
+    'flush_max_retries': 3,     # Failed flushes before the batch is written row by row and failing rows set aside
     'custom_pallet_table': 'custom_pallets',
-    'custom_keg_table': 'custom_keg_locations'
+    'custom_keg_table': 'custom_keg_locations',
+    'pallet_keg_table': 'custom_pallet_kegs',  # Normalized (pallet_id, keg_qr) rows
+    'outbox_table': 'dispatch_outbox',         # Durable queue of pending cloud dispatches
+    'customer_cache_table': 'customer_cache'   # Last customer list fetched from the cloud
 }
 
 # ========== CAMERA CONFIGURATION (UPDATED) ==========
@@ -26,7 +34,90 @@ TOP_CAMERA_CONFIG = {
     'width': 1920,    # UPDATED: Full HD
     'height': 1080,   # UPDATED: Full HD
     'fps': 30,
-    'purpose': 'top_camera'
+    'purpose': 'top_camera',
+    'threaded_grab': True,  # Drain the device on a grabber thread so frames never go stale in the V4L2 buffer
+    'ring_size': 4,         # Preallocated frames kept by the grabber thread
+    'replay_source': None,  # Video file or image directory to play back instead of the device
+    'replay_realtime': True,  # Pace replay at the recorded fps (False = as fast as possible)
+    'replay_loop': False
+}
+
+# ========== MULTI-CAMERA CONFIGURATION ==========
+MULTI_CAMERA_CONFIG = {
+    # One entry per camera; each has its own session/controller and overrides TOP_CAMERA_CONFIG keys.
+    # With more than one entry the app runs a station per camera; the HMI shows the first
+    'cameras': [
+        {'name': 'top', 'device': 10},
+        # {'name': 'lane2', 'device': 12},
+    ],
+    'stats_interval': 10.0  # Seconds between per-camera fps / queue depth log lines (0 = off)
+}
+
+# ========== DETECTION CONFIGURATION ==========
+DETECTION_CONFIG = {
+    'backend': 'ultralytics',    # 'ultralytics' (PyTorch best.pt) or 'onnx' (onnxruntime best.onnx)
+    'onnx_providers': ['CPUExecutionProvider'],  # e.g. ['OpenVINOExecutionProvider'] with onnxruntime-openvino
+    'onnx_imgsz': 640,           # Dynamic-shape ONNX input size when predict() is given no imgsz
+    'nms_iou': 0.7,              # NMS IoU threshold for the ONNX backend (matches ultralytics default)
+    'confidence': 0.5,
+    'infer_width': 960,          # YOLO runs on a copy downscaled to this width, at a network input of the same size (None = full resolution)
+    'crop_padding': 10,          # Pixels added around each YOLO box before QR decoding
+    'track_iou_threshold': 0.5,  # Minimum IoU to treat a box as the same keg as last frame
+    'track_max_misses': 5,       # Frames a keg may go undetected before its track is dropped
+    'reverify_interval': 30,     # Re-decode an already resolved keg every N frames
+    'vote_min_agree': 2,         # Agreeing decodes needed before a keg ID is committed (1 = trust every read)
+    'vote_window': 6.0,          # Seconds within which those decodes must agree; keep it above two keep-alive
+                                 # intervals, since a static scene is only detected every keepalive_interval
+    'vote_buffer': 8,            # Decodes remembered per tracked keg (bounds memory on long shifts)
+    'batch_size': 4,             # Max frames per model call when several cameras share the model (BatchedDetector,
+                                 # capped at one frame per camera); no effect with a single camera, whose
+                                 # pipeline keeps only one frame in flight
+    'batch_max_wait_ms': 15,     # Max time to wait for a batch to fill before running it
+    'overlay_mode': True         # Return box metadata and draw it at display size instead of annotating a full-frame copy
+}
+
+# ========== QR DECODE CONFIGURATION ==========
+DECODE_CONFIG = {
+    'executor': 'thread',  # 'serial', 'thread' or 'process' (shared-memory crops)
+    'pool_size': 4,        # Decode workers; None uses os.cpu_count()
+    # Strategies tried in turn on a crop until one reads a code (names in qr_decode.STRATEGIES)
+    'strategies': ['gray', 'clahe', 'adaptive', 'upscale', 'opencv', 'wechat'],
+    'crop_budget_ms': 15,  # Per-crop budget: a strategy is skipped if its expected cost (per pixel) would overrun it
+    'probe_every': 20,     # A strategy skipped this many times in a row runs once anyway to refresh its cost
+    'learn_order': True    # Try the strategy that has succeeded most often on this camera first
+}
+
+# ========== PIPELINE CONFIGURATION ==========
+PIPELINE_CONFIG = {
+    'frame_queue_size': 1,    # Latest-frame queue between capture and detection (stale frames are dropped)
+    'read_retry_delay': 0.01, # Seconds to back off when the camera returns no frame
+    'mode': 'thread',         # 'thread' (one process) or 'process' (capture / detection in their own processes)
+    'ring_slots': 6           # Shared-memory frames in process mode (in flight + shown + being written)
+}
+
+# ========== DETECTION SCHEDULER CONFIGURATION ==========
+SCHEDULER_CONFIG = {
+    'enabled': True,            # False = detect on every captured frame
+    'motion_threshold': 6.0,    # Mean grey-level difference (0-255) that counts as a scene change
+    'keepalive_interval': 2.0,  # Seconds between detections on a static scene
+    'headroom': 1.25,           # Min spacing between detections = inference time x headroom
+    'thumb_step': 16,           # Pixel stride of the motion thumbnail (1920x1080 -> 120x68)
+    'rate_window': 5.0          # Seconds averaged for the effective detection rate
+}
+
+# ========== DISPLAY CONFIGURATION ==========
+DISPLAY_CONFIG = {
+    'fit_to_widget': True   # Downscale frames to the camera widget's pixel size before texture upload
+}
+
+# ========== METRICS CONFIGURATION ==========
+METRICS_CONFIG = {
+    'enabled': False,           # Per-stage latency timers (no-op when disabled)
+    'window': 1024,             # Samples kept per stage for p50/p95/p99
+    'http_enabled': True,       # Serve Prometheus text at /metrics when metrics are enabled
+    'http_host': '127.0.0.1',
+    'http_port': 9109,
+    'overlay_interval': 1.0     # Seconds between HMI overlay refreshes
 }
 
 # ========== SYSTEM CONFIGURATION ==========
@@ -41,14 +132,43 @@ SYSTEM_CONFIG = {
 API_CONFIG = {
     'customer_api_url': "http://143.110.186.93:5001/api/kegs/customers-for-cam",
     'pallet_create_url': "http://143.110.186.93:5001/api/kegs/custom-palette-dispatch",
-    'api_timeout': 10,
-    'max_retries': 3
+    'api_timeout': 10,        # Read timeout (seconds)
+    'connect_timeout': 3.05,  # TCP connect timeout (seconds)
+    'max_retries': 3,
+    'backoff_base': 0.5,      # First retry waits up to this long; doubles every attempt
+    'backoff_max': 8.0,       # Upper bound for a single backoff delay
+    'pool_maxsize': 4         # Keep-alive connections kept per host
+}
+
+# ========== CUSTOMER CACHE CONFIGURATION ==========
+CUSTOMER_CACHE_CONFIG = {
+    'ttl': 900   # Seconds a cached customer list is considered fresh (no refresh at boot)
+}
+
+# ========== DISPATCH OUTBOX CONFIGURATION ==========
+OUTBOX_CONFIG = {
+    'enabled': True,          # Submit returns immediately; a background worker sends to the cloud
+    'max_concurrency': 2,     # Dispatches in flight at once
+    'retry_base': 5.0,        # Seconds before the first retry; doubles every attempt (jittered)
+    'retry_max': 300.0,       # Upper bound for the retry delay
+    'max_attempts': None,     # None = keep retrying transient failures until they succeed
+    'server_dedupes': False,  # Server honours Idempotency-Key: sends that may have reached it (read
+                              # timeouts, 5xx, restart mid-send) are retried instead of held for review
+    'poll_interval': 1.0,     # How often the worker checks for due retries
+    'stop_timeout': 10.0      # On exit, seconds to wait for sends in flight before the database closes
 }
 
 # ========== WEBSOCKET CONFIGURATION ==========
 WEBSOCKET_CONFIG = {
     "url": "http://143.110.186.93:5001", 
-    "reconnection_delay": 5
+    "reconnection_delay": 5,        # First reconnect delay (seconds), doubled per failed attempt
+    "reconnection_delay_max": 120,  # Backoff cap; the jitter spreads a fleet reconnecting after an outage
+    "connect_timeout": 5,
+    "heartbeat_interval": 15,       # Seconds between liveness checks while connected
+    "heartbeat_event": None,        # Event name acked by the server (e.g. 'ping'); None = engine.io ping/pong only
+    "heartbeat_timeout": 5,
+    "heartbeat_max_misses": 2,      # Unanswered heartbeats before the connection is dropped and re-dialled
+    "message_queue_size": 100       # Messages held for the UI thread; the oldest are dropped when full
 }
 
 # ========== UI COLORS ==========
@@ -63,6 +183,7 @@ COLOR_SCHEME = {
 }
 
 QRCODE_MODEL_PATH = MODEL_PATH / "best.pt"
+ONNX_MODEL_PATH = MODEL_PATH / "best.onnx"
 
 # ========== LOGGING SETUP ==========
 def setup_logging():
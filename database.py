@@ -2,9 +2,13 @@
 import sqlite3
 import json
 import logging
+import threading
+import atexit
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from config import DB_PATH, DB_CONFIG, logger
+from metrics import get_metrics
 
 class DatabaseManager:
     """Manages database operations for custom pallets"""
@@ -13,13 +17,51 @@ class DatabaseManager:
         self.db_path = str(db_path) if db_path else str(DB_PATH)
         self.logger = logger
         
+        # One long-lived connection shared by all threads, serialized by a lock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout'], check_same_thread=False)
+        self._configure_connection()
+        
+        # Write-behind queue: keg inserts are grouped into one transaction per flush
+        self.write_behind = DB_CONFIG.get('write_behind', True)
+        self._pending_kegs = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Consecutive failed flushes; after flush_max_retries the batch is split row by row
+        self._flush_failures = 0
+        # Rows that could not be written on their own (also logged in full)
+        self.failed_kegs = []
+        self._writer_stop = threading.Event()
+        self._writer_thread = None
+        self._closed = False
+        
         # Initialize database
         self._init_database()
+        
+        if self.write_behind:
+            self._writer_thread = threading.Thread(target=self._writer_loop, name="DBWriter", daemon=True)
+            self._writer_thread.start()
+        # Pending writes must reach disk on a clean interpreter exit
+        atexit.register(self.close)
+    
+    def _configure_connection(self):
+        """WAL lets readers run alongside the writer; synchronous=NORMAL skips the per-commit fsync"""
+        cur = self._conn.cursor()
+        mode = cur.execute(f"PRAGMA journal_mode={DB_CONFIG.get('journal_mode', 'WAL')}").fetchone()[0]
+        cur.execute(f"PRAGMA synchronous={DB_CONFIG.get('synchronous', 'NORMAL')}")
+        self.logger.info(f"Database connection opened (journal_mode={mode})")
+    
+    @contextmanager
+    def _transaction(self):
+        """Exclusive use of the shared connection; commits on success, rolls back on error"""
+        with self._lock:
+            with self._conn:
+                yield self._conn
     
     def _init_database(self):
         """Initialize database tables"""
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
+            with self._transaction() as conn:
                 cur = conn.cursor()
                 
                 # Custom pallets table
@@ -70,17 +112,101 @@ class DatabaseManager:
                     ON {DB_CONFIG['custom_pallet_table']}(customer_name)
                 ''')
                 
-                conn.commit()
+                cur.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_custom_keg_pallet 
+                    ON {DB_CONFIG['custom_keg_table']}(custom_pallet_id)
+                ''')
+                
+                # Normalized keg table: one row per (pallet, QR), no JSON parsing on read
+                cur.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {DB_CONFIG['pallet_keg_table']} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        pallet_id TEXT NOT NULL,
+                        keg_qr TEXT NOT NULL,
+                        source_location TEXT,
+                        added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (pallet_id, keg_qr)
+                    )
+                ''')
+                
+                # The UNIQUE index serves per-pallet listing; this one serves cross-pallet lookup
+                cur.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_pallet_kegs_qr 
+                    ON {DB_CONFIG['pallet_keg_table']}(keg_qr)
+                ''')
+                
+                # Durable outbox of cloud dispatches, drained by outbox.DispatchOutbox
+                cur.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {DB_CONFIG['outbox_table']} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        pallet_id TEXT NOT NULL,
+                        payload TEXT NOT NULL,              -- JSON: keg_ids, customer_id, area_name
+                        status TEXT DEFAULT 'pending',      -- pending / sending / sent / failed / review
+                        attempts INTEGER DEFAULT 0,
+                        next_attempt_at REAL DEFAULT 0,     -- Unix time of the next try
+                        last_error TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                cur.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_outbox_due 
+                    ON {DB_CONFIG['outbox_table']}(status, next_attempt_at)
+                ''')
+                
+                cur.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {DB_CONFIG['customer_cache_table']} (
+                        cache_key TEXT PRIMARY KEY,
+                        payload TEXT NOT NULL,      -- JSON list of customer name/id objects
+                        content_hash TEXT,
+                        etag TEXT,
+                        last_modified TEXT,
+                        fetched_at REAL             -- Unix time of the last successful check
+                    )
+                ''')
+                
+                self._migrate(cur)
+                
                 self.logger.info("Database initialized successfully")
         
         except Exception as e:
             self.logger.error(f"Failed to initialize database: {e}")
             raise
     
+    def _migrate(self, cur):
+        """Schema migrations, tracked with PRAGMA user_version"""
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            # Expand the JSON keg_qrs arrays of existing rows into the normalized table
+            rows = cur.execute(f'''
+                SELECT custom_pallet_id, source_location, keg_qrs, taken_at
+                FROM {DB_CONFIG['custom_keg_table']}
+                ORDER BY id
+            ''').fetchall()
+            
+            normalized = []
+            for pallet_id, location, keg_qrs, taken_at in rows:
+                try:
+                    qr_codes = json.loads(keg_qrs or '[]')
+                except (TypeError, ValueError):
+                    self.logger.warning(f"Skipping unreadable keg_qrs for pallet {pallet_id}")
+                    continue
+                normalized.extend((pallet_id, str(qr), location, taken_at) for qr in qr_codes if qr)
+            
+            cur.executemany(f'''
+                INSERT OR IGNORE INTO {DB_CONFIG['pallet_keg_table']}
+                (pallet_id, keg_qr, source_location, added_at)
+                VALUES (?, ?, ?, ?)
+            ''', normalized)
+            cur.execute("PRAGMA user_version = 1")
+            self.logger.info(f"Migrated {len(normalized)} kegs into {DB_CONFIG['pallet_keg_table']}")
+    
     def create_custom_pallet(self, pallet_data: Dict[str, Any]) -> bool:
         """Create a new custom pallet record"""
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
+            with self._transaction() as conn:
                 cur = conn.cursor()
                 
                 # Convert lists to JSON strings
@@ -106,7 +232,6 @@ class DatabaseManager:
                     pallet_data.get('notes', '')
                 ))
                 
-                conn.commit()
                 self.logger.info(f"Created pallet record: {pallet_data.get('pallet_id')}")
                 return True
         
@@ -118,31 +243,127 @@ class DatabaseManager:
             return False
     
     def add_keg_entry(self, pallet_id: str, location: str, count: int, qr_codes: List[str] = None) -> bool:
-        """Add keg entry to database"""
+        """
+        Add keg entry to database.
+        With write_behind enabled the row is queued and committed by the writer
+        thread with the other pending rows in a single transaction.
+        """
+        row = (pallet_id, location, count, list(qr_codes or []))
+        
+        if self.write_behind and not self._closed:
+            with self._pending_lock:
+                self._pending_kegs.append(row)
+            return True
+        
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
-                cur = conn.cursor()
-                
-                keg_qrs = json.dumps(qr_codes or [])
-                
-                cur.execute(f'''
-                    INSERT INTO {DB_CONFIG['custom_keg_table']} 
-                    (custom_pallet_id, source_location, keg_count, keg_qrs, operator)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (pallet_id, location, count, keg_qrs, 'Operator'))
-                
-                conn.commit()
-                self.logger.info(f"Added keg entry: {count} kegs from {location} to {pallet_id}")
-                return True
+            self._insert_keg_rows([row])
+            self.logger.info(f"Added keg entry: {count} kegs from {location} to {pallet_id}")
+            return True
         
         except Exception as e:
             self.logger.error(f"Failed to add keg entry: {e}")
             return False
     
+    def add_keg_entries(self, pallet_id: str, location: str, qr_codes: List[str]) -> bool:
+        """
+        Bulk version of add_keg_entry: one row per keg (count 1), written in a
+        single transaction (or a single append to the write-behind queue).
+        """
+        rows = [(pallet_id, location, 1, [qr]) for qr in qr_codes]
+        if not rows:
+            return True
+        
+        if self.write_behind and not self._closed:
+            with self._pending_lock:
+                self._pending_kegs.extend(rows)
+            return True
+        
+        try:
+            self._insert_keg_rows(rows)
+            self.logger.info(f"Added {len(rows)} keg entries from {location} to {pallet_id}")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Failed to add keg entries: {e}")
+            return False
+    
+    def _insert_keg_rows(self, rows):
+        """rows: (pallet_id, location, count, qr_codes); written to both keg tables in one transaction"""
+        with get_metrics().timer('db_insert_keg_rows'), self._transaction() as conn:
+            conn.executemany(f'''
+                INSERT INTO {DB_CONFIG['custom_keg_table']} 
+                (custom_pallet_id, source_location, keg_count, keg_qrs, operator)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(pallet_id, location, count, json.dumps(qr_codes), 'Operator')
+                  for pallet_id, location, count, qr_codes in rows])
+            
+            conn.executemany(f'''
+                INSERT OR IGNORE INTO {DB_CONFIG['pallet_keg_table']}
+                (pallet_id, keg_qr, source_location)
+                VALUES (?, ?, ?)
+            ''', [(pallet_id, qr, location)
+                  for pallet_id, location, _, qr_codes in rows for qr in qr_codes])
+    
+    def flush(self) -> int:
+        """Commit all queued keg entries now; returns the number of rows written"""
+        with self._flush_lock:
+            with self._pending_lock:
+                rows, self._pending_kegs = self._pending_kegs, []
+            if not rows:
+                return 0
+            
+            try:
+                self._insert_keg_rows(rows)
+                self._flush_failures = 0
+                self.logger.info(f"Flushed {len(rows)} keg entries to database")
+                return len(rows)
+            except Exception as e:
+                self._flush_failures += 1
+                if self._flush_failures < DB_CONFIG.get('flush_max_retries', 3):
+                    self.logger.error(f"Failed to flush keg entries (will retry): {e}")
+                    # Put them back in front so order and durability are kept
+                    with self._pending_lock:
+                        self._pending_kegs[:0] = rows
+                    return 0
+                self.logger.error(f"Failed to flush keg entries {self._flush_failures} times ({e}); writing row by row")
+            
+            # A row that always fails must not block every later keg write
+            self._flush_failures = 0
+            written = 0
+            for row in rows:
+                try:
+                    self._insert_keg_rows([row])
+                    written += 1
+                except Exception as e:
+                    self.failed_kegs.append(row)
+                    get_metrics().increment('db_keg_rows_set_aside')
+                    self.logger.error(f"Keg entry set aside after failed writes: pallet={row[0]} "
+                                      f"location={row[1]} qr_codes={row[3]}: {e}")
+            return written
+    
+    def _writer_loop(self):
+        interval = DB_CONFIG.get('flush_interval_ms', 200) / 1000.0
+        while not self._writer_stop.wait(interval):
+            self.flush()
+    
+    def close(self):
+        """Stop the writer, commit anything still queued and close the connection"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writer_stop.set()
+        if self._writer_thread is not None:
+            self._writer_thread.join(timeout=5.0)
+            self._writer_thread = None
+        self.flush()
+        with self._lock:
+            self._conn.close()
+        self.logger.info("Database closed")
+    
     def update_pallet_status(self, pallet_id: str, status: str, **kwargs) -> bool:
         """Update pallet status and other fields"""
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
+            with self._transaction() as conn:
                 cur = conn.cursor()
                 
                 # Build update query dynamically
@@ -172,7 +393,6 @@ class DatabaseManager:
                     WHERE pallet_id = ?
                 ''', params)
                 
-                conn.commit()
                 self.logger.info(f"Updated pallet {pallet_id} status to {status}")
                 return True
         
@@ -183,9 +403,9 @@ class DatabaseManager:
     def get_pallet(self, pallet_id: str) -> Optional[Dict[str, Any]]:
         """Get pallet by ID"""
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._transaction() as conn:
                 cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
                 
                 cur.execute(f'''
                     SELECT * FROM {DB_CONFIG['custom_pallet_table']}
@@ -208,9 +428,9 @@ class DatabaseManager:
     def get_recent_pallets(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent custom pallets"""
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._transaction() as conn:
                 cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
                 
                 cur.execute(f'''
                     SELECT pallet_id, total_kegs, status, customer_name,
@@ -229,10 +449,12 @@ class DatabaseManager:
     
     def get_keg_entries(self, pallet_id: str) -> List[Dict[str, Any]]:
         """Get all keg entries for a pallet"""
+        # Make queued writes visible to the read
+        self.flush()
         try:
-            with sqlite3.connect(self.db_path, timeout=DB_CONFIG['timeout']) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._transaction() as conn:
                 cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
                 
                 cur.execute(f'''
                     SELECT * FROM {DB_CONFIG['custom_keg_table']}
@@ -252,6 +474,268 @@ class DatabaseManager:
             self.logger.error(f"Failed to get keg entries: {e}")
             return []
 
+    
+    def get_pallet_kegs(self, pallet_id: str) -> List[str]:
+        """QR codes on a pallet, in scan order (served by the (pallet_id, keg_qr) index)"""
+        self.flush()
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    SELECT keg_qr FROM {DB_CONFIG['pallet_keg_table']}
+                    WHERE pallet_id = ?
+                    ORDER BY id
+                ''', (pallet_id,))
+                return [row[0] for row in cur.fetchall()]
+        
+        except Exception as e:
+            self.logger.error(f"Failed to get pallet kegs: {e}")
+            return []
+    
+    def find_keg_pallets(self, keg_qr: str, exclude_pallet_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Other pallets a keg QR was already recorded on, newest first"""
+        return self.find_duplicate_kegs([keg_qr], exclude_pallet_id).get(keg_qr, [])
+    
+    def find_duplicate_kegs(self, keg_qrs: List[str], exclude_pallet_id: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Cross-pallet duplicate lookup for a batch of QRs (uses the keg_qr index).
+        Returns {keg_qr: [{'pallet_id', 'status', 'added_at'}, ...]} for QRs found elsewhere.
+        """
+        self.flush()
+        duplicates: Dict[str, List[Dict[str, Any]]] = {}
+        qrs = list(dict.fromkeys(keg_qrs))
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                # Stay below SQLite's bound-parameter limit
+                for start in range(0, len(qrs), 500):
+                    chunk = qrs[start:start + 500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    cur.execute(f'''
+                        SELECT k.keg_qr, k.pallet_id, k.added_at, p.status
+                        FROM {DB_CONFIG['pallet_keg_table']} k
+                        LEFT JOIN {DB_CONFIG['custom_pallet_table']} p ON p.pallet_id = k.pallet_id
+                        WHERE k.keg_qr IN ({placeholders}) AND k.pallet_id != ?
+                        ORDER BY k.id DESC
+                    ''', (*chunk, exclude_pallet_id or ''))
+                    for row in cur.fetchall():
+                        duplicates.setdefault(row['keg_qr'], []).append({
+                            'pallet_id': row['pallet_id'],
+                            'status': row['status'],
+                            'added_at': row['added_at']
+                        })
+                return duplicates
+        
+        except Exception as e:
+            self.logger.error(f"Failed to look up duplicate kegs: {e}")
+            return {}
+
+    
+    # ========== DISPATCH OUTBOX ==========
+    def enqueue_dispatch(self, pallet_id: str, payload: Dict[str, Any]) -> Optional[int]:
+        """Persist a pending cloud dispatch; returns its outbox id"""
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    INSERT INTO {DB_CONFIG['outbox_table']} (pallet_id, payload)
+                    VALUES (?, ?)
+                ''', (pallet_id, json.dumps(payload)))
+                self.logger.info(f"Queued dispatch #{cur.lastrowid} for pallet {pallet_id}")
+                return cur.lastrowid
+        
+        except Exception as e:
+            self.logger.error(f"Failed to queue dispatch: {e}")
+            return None
+    
+    def claim_due_dispatches(self, now: float, limit: int) -> List[Dict[str, Any]]:
+        """Atomically move up to `limit` due dispatches from pending to sending"""
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                cur.execute(f'''
+                    SELECT id, pallet_id, payload, attempts
+                    FROM {DB_CONFIG['outbox_table']}
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (now, limit))
+                
+                jobs = []
+                for row in cur.fetchall():
+                    job = dict(row)
+                    job['payload'] = json.loads(job['payload'])
+                    jobs.append(job)
+                
+                cur.executemany(f'''
+                    UPDATE {DB_CONFIG['outbox_table']}
+                    SET status = 'sending', updated_at = DATETIME('now')
+                    WHERE id = ?
+                ''', [(job['id'],) for job in jobs])
+                return jobs
+        
+        except Exception as e:
+            self.logger.error(f"Failed to claim dispatches: {e}")
+            return []
+    
+    def finish_dispatch(self, outbox_id: int, status: str, attempts: int,
+                        error: Optional[str] = None, next_attempt_at: float = 0) -> bool:
+        """Record the outcome of a send: 'sent', 'failed', 'review', or 'pending' to retry at next_attempt_at"""
+        try:
+            with self._transaction() as conn:
+                conn.execute(f'''
+                    UPDATE {DB_CONFIG['outbox_table']}
+                    SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?,
+                        updated_at = DATETIME('now')
+                    WHERE id = ?
+                ''', (status, attempts, error, next_attempt_at, outbox_id))
+                return True
+        
+        except Exception as e:
+            self.logger.error(f"Failed to update dispatch #{outbox_id}: {e}")
+            return False
+    
+    def recover_interrupted_dispatches(self, status: str = 'pending') -> List[str]:
+        """
+        Dispatches left in 'sending' by a previous run go to `status`: 'pending'
+        to resend, or 'review' when a resend could duplicate one the server
+        already accepted. Returns their pallet IDs.
+        """
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    SELECT pallet_id FROM {DB_CONFIG['outbox_table']}
+                    WHERE status = 'sending'
+                ''')
+                pallet_ids = [row[0] for row in cur.fetchall()]
+                cur.execute(f'''
+                    UPDATE {DB_CONFIG['outbox_table']}
+                    SET status = ?, updated_at = DATETIME('now')
+                    WHERE status = 'sending'
+                ''', (status,))
+                return pallet_ids
+        
+        except Exception as e:
+            self.logger.error(f"Failed to recover interrupted dispatches: {e}")
+            return []
+    
+    def get_review_dispatches(self) -> List[Dict[str, Any]]:
+        """Dispatches held for an operator decision, oldest first"""
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                cur.execute(f'''
+                    SELECT id, pallet_id, payload, attempts, last_error, updated_at
+                    FROM {DB_CONFIG['outbox_table']}
+                    WHERE status = 'review'
+                    ORDER BY id
+                ''')
+                
+                reviews = []
+                for row in cur.fetchall():
+                    review = dict(row)
+                    review['payload'] = json.loads(review['payload'])
+                    reviews.append(review)
+                return reviews
+        
+        except Exception as e:
+            self.logger.error(f"Failed to load dispatches held for review: {e}")
+            return []
+    
+    def resolve_dispatch_review(self, outbox_id: int, resend: bool) -> Optional[str]:
+        """
+        Operator decision on a dispatch held for review: resend it, or record it
+        as sent. Returns its pallet ID, or None if it was not held for review.
+        """
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    UPDATE {DB_CONFIG['outbox_table']}
+                    SET status = ?, next_attempt_at = 0, updated_at = DATETIME('now')
+                    WHERE id = ? AND status = 'review'
+                ''', ('pending' if resend else 'sent', outbox_id))
+                if cur.rowcount == 0:
+                    return None
+                row = cur.execute(f'''
+                    SELECT pallet_id FROM {DB_CONFIG['outbox_table']} WHERE id = ?
+                ''', (outbox_id,)).fetchone()
+                return row[0]
+        
+        except Exception as e:
+            self.logger.error(f"Failed to resolve dispatch #{outbox_id}: {e}")
+            return None
+    
+    def count_pending_dispatches(self) -> int:
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(f'''
+                    SELECT COUNT(*) FROM {DB_CONFIG['outbox_table']}
+                    WHERE status IN ('pending', 'sending')
+                ''').fetchone()
+                return row[0]
+        
+        except Exception as e:
+            self.logger.error(f"Failed to count pending dispatches: {e}")
+            return 0
+
+    
+    # ========== CUSTOMER CACHE ==========
+    def get_customer_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Cached customer list with its validators, or None"""
+        try:
+            with self._transaction() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                cur.execute(f'''
+                    SELECT * FROM {DB_CONFIG['customer_cache_table']}
+                    WHERE cache_key = ?
+                ''', (cache_key,))
+                row = cur.fetchone()
+                if row:
+                    cache = dict(row)
+                    cache['customers'] = json.loads(cache.pop('payload') or '[]')
+                    return cache
+                return None
+        
+        except Exception as e:
+            self.logger.error(f"Failed to read customer cache: {e}")
+            return None
+    
+    def save_customer_cache(self, cache_key: str, customers: List[Dict[str, str]], content_hash: str,
+                            etag: Optional[str], last_modified: Optional[str], fetched_at: float) -> bool:
+        try:
+            with self._transaction() as conn:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO {DB_CONFIG['customer_cache_table']}
+                    (cache_key, payload, content_hash, etag, last_modified, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (cache_key, json.dumps(customers), content_hash, etag, last_modified, fetched_at))
+                return True
+        
+        except Exception as e:
+            self.logger.error(f"Failed to save customer cache: {e}")
+            return False
+    
+    def touch_customer_cache(self, cache_key: str, fetched_at: float) -> bool:
+        """Mark an unchanged cached list as freshly validated"""
+        try:
+            with self._transaction() as conn:
+                conn.execute(f'''
+                    UPDATE {DB_CONFIG['customer_cache_table']}
+                    SET fetched_at = ?
+                    WHERE cache_key = ?
+                ''', (fetched_at, cache_key))
+                return True
+        
+        except Exception as e:
+            self.logger.error(f"Failed to update customer cache: {e}")
+            return False
+
 # Singleton instance
 _db_instance = None
 
@@ -1,62 +1,374 @@
 # detector.py
+import threading
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from pyzbar.pyzbar import decode
-from config import logger, QRCODE_MODEL_PATH # Imported the specific path
+from config import logger, QRCODE_MODEL_PATH, DETECTION_CONFIG # Imported the specific path
+from detector_backends import create_backend
+from tracker import BoxTracker
+from qr_decode import DecodeExecutor
+from metrics import get_metrics
+from display import BoxOverlay, draw_overlays
 
 class KegDetector:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, decode_executor=None, backend=None):
         self.logger = logger
+        self.config = DETECTION_CONFIG
         self.model = None
+        self.backend_name = backend or self.config.get('backend', 'ultralytics')
+        # Kegs are large from the top view: detect on a downscaled copy, decode QR from the original
+        self.infer_width = self.config.get('infer_width')
         
         # Use the passed path or fallback to the config path
         # str() is used because YOLO sometimes prefers string over Path objects
         self.model_path = str(model_path) if model_path else str(QRCODE_MODEL_PATH)
         
+        # Remembers which boxes already have a decoded ID so pyzbar only runs on new ones.
+        # One tracker per camera source when the model is shared (source None = single camera)
+        self.tracker = self._new_tracker()
+        self._trackers = {None: self.tracker}
+        
+        # An ID is only committed after vote_min_agree matching decodes within vote_window
+        self.vote_min_agree = max(1, int(self.config.get('vote_min_agree', 2)))
+        self.vote_window = self.config.get('vote_window', 6.0)
+        self.vote_buffer = self.config.get('vote_buffer', 8)
+        self.ids_confirmed = 0
+        self.misreads_rejected = 0
+        
+        # Overlay mode: hand back box metadata and let the display draw it at screen size
+        self.overlay_mode = self.config.get('overlay_mode', True)
+        
+        # Fans the crops of a frame out to the configured decode pool
+        self.decode_executor = decode_executor or DecodeExecutor()
+        
         try:
-            self.model = YOLO(self.model_path)
+            # Inference backend (ultralytics / onnxruntime) selected in config.py
+            self.model = create_backend(self.backend_name, self.model_path)
             self.logger.info(f"YOLO model loaded successfully from: {self.model_path}")
         except Exception as e:
             self.logger.error(f"Failed to load YOLO model from {self.model_path}: {e}")
 
+    def _new_tracker(self):
+        return BoxTracker(
+            iou_threshold=self.config.get('track_iou_threshold', 0.5),
+            max_misses=self.config.get('track_max_misses', 5)
+        )
+
+    def _tracker_for(self, source):
+        tracker = self._trackers.get(source)
+        if tracker is None:
+            tracker = self._trackers.setdefault(source, self._new_tracker())
+        return tracker
+
+    def reset_tracking(self, source=None):
+        """
+        Forget tracked boxes of one camera source, e.g. when a new pallet session
+        starts. Called from the UI thread, so the reset is applied by the
+        detection thread before its next frame.
+        """
+        self._tracker_for(source).request_reset()
+
     def detect_and_decode(self, frame):
+        """(frame, ids); the frame is annotated unless overlay_mode is on"""
+        frame, ids, _ = self.detect_with_overlays(frame)
+        return frame, ids
+
+    def detect_with_overlays(self, frame):
+        """(frame, ids, overlays); overlays is empty when the boxes were drawn into the frame"""
         if self.model is None or frame is None:
-            return frame, []
+            return frame, [], []
+        return self.detect_batch([frame])[0]
 
-        detected_ids = set()
-        annotated_frame = frame.copy()
+    def detect_batch(self, frames, sources=None):
+        """
+        Runs YOLO once over a list of frames and decodes each.
+        sources names the camera of each frame (for tracking); frames of one
+        source must be in capture order. Returns a list of (frame, ids, overlays)
+        in the same order as frames: the untouched frame plus BoxOverlay list in
+        overlay_mode, otherwise an annotated copy and no overlays.
+        """
+        if self.model is None:
+            return [(frame, [], []) for frame in frames]
+        sources = sources if sources is not None else [None] * len(frames)
         
+        valid = [frame for frame in frames if frame is not None]
         try:
             # Run Inference
-            results = self.model(frame, verbose=False, conf=0.5)
+            batch_boxes = iter(self._infer(valid))
+        except Exception as e:
+            self.logger.error(f"Error during detection: {e}")
+            return [(frame, [], []) for frame in frames]
+        
+        # Tracking is order dependent, so decode frames sequentially
+        return [self._decode_frame(frame, next(batch_boxes), self._tracker_for(source)) if frame is not None else (frame, [], [])
+                for frame, source in zip(frames, sources)]
+
+    def _infer(self, frames) -> List[List[tuple]]:
+        """
+        YOLO boxes (x1, y1, x2, y2) for each frame, from a single model call.
+        Boxes are always in full-resolution frame coordinates.
+        """
+        if not frames:
+            return []
+        
+        inputs, scales = [], []
+        for frame in frames:
+            small, scale = self._downscale(frame)
+            inputs.append(small)
+            scales.append(scale)
+        
+        with get_metrics().timer('model_inference'):
+            results = self.model.predict(inputs, conf=self.config.get('confidence', 0.5),
+                                         imgsz=self._model_input_size(inputs))
+        
+        batch_boxes = []
+        for frame, (sx, sy), detections in zip(frames, scales, results):
+            h, w = frame.shape[:2]
+            boxes = []
+            for x1, y1, x2, y2, _ in detections:
+                boxes.append((
+                    min(max(int(x1 * sx), 0), w), min(max(int(y1 * sy), 0), h),
+                    min(max(int(x2 * sx), 0), w), min(max(int(y2 * sy), 0), h)
+                ))
+            batch_boxes.append(boxes)
+        return batch_boxes
+
+    @staticmethod
+    def _model_input_size(inputs) -> int:
+        """Network input size for these inference inputs: their long side, rounded up to a multiple of 32"""
+        long_side = max(max(frame.shape[:2]) for frame in inputs)
+        return -(-long_side // 32) * 32
+
+    def _downscale(self, frame):
+        """Returns (inference_input, (scale_x, scale_y)) mapping input coords back to the frame"""
+        h, w = frame.shape[:2]
+        if not self.infer_width or w <= self.infer_width:
+            return frame, (1.0, 1.0)
+        new_w = int(self.infer_width)
+        new_h = max(1, int(round(h * new_w / w)))
+        small = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return small, (w / new_w, h / new_h)
+
+    def _decode_frame(self, frame, boxes, tracker=None):
+        detected_ids = set()
+        overlays = []
+        reverify_interval = self.config.get('reverify_interval', 30)
+        tracker = tracker or self.tracker
+        
+        try:
+            tracks = tracker.update(boxes)
+            frame_index = tracker.frame_index
+            for track in tracker.dropped:
+                self._count_misreads(track.drop_votes())
+            
+            # Only decode new/unresolved kegs; resolved ones are re-verified every N frames
+            to_decode = [i for i, track in enumerate(tracks)
+                         if track.qr_id is None or frame_index - track.last_decode_frame >= reverify_interval]
+            # The full fallback chain is for unresolved kegs; re-verifies try only the learned best strategy
+            decoded = self.decode_executor.decode_all([self._crop(frame, boxes[i]) for i in to_decode],
+                                                      [tracks[i].qr_id is None for i in to_decode])
+            decoded_by_box = dict(zip(to_decode, decoded))
             
-            for result in results:
-                for box in result.boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    
-                    # Draw Searching Box (Orange)
-                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 165, 255), 2)
-                    
-                    # Crop logic
-                    h, w, _ = frame.shape
-                    pad = 10
-                    crop_y1, crop_y2 = max(0, y1-pad), min(h, y2+pad)
-                    crop_x1, crop_x2 = max(0, x1-pad), min(w, x2+pad)
-                    crop_img = frame[crop_y1:crop_y2, crop_x1:crop_x2]
-                    
-                    if crop_img.size > 0:
-                        decoded_objs = decode(crop_img)
-                        for obj in decoded_objs:
-                            qr_data = obj.data.decode('utf-8')
-                            if qr_data:
-                                detected_ids.add(qr_data)
-                                # Success Box (Green)
-                                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 3)
-                                cv2.putText(annotated_frame, qr_data, (x1, y1-10),
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            now = time.monotonic()
+            for i, (box, track) in enumerate(zip(boxes, tracks)):
+                if i in decoded_by_box:
+                    for qr_data in decoded_by_box[i]:
+                        self._vote(track, qr_data, now)
+                    if track.qr_id is not None:
+                        # Also rate-limit failed re-verifies (e.g. glare) of resolved kegs
+                        track.last_decode_frame = frame_index
+                if track.qr_id:
+                    detected_ids.add(track.qr_id)
+                
+                # Green box + ID once decoded, orange while still searching
+                overlays.append(BoxOverlay(box, track.qr_id))
                                       
         except Exception as e:
             self.logger.error(f"Error during detection: {e}")
+        
+        if self.overlay_mode:
+            # The raw frame is not touched: the display draws the overlays at its own resolution
+            return frame, list(detected_ids), overlays
+        return draw_overlays(frame.copy(), overlays), list(detected_ids), []
+
+    def _vote(self, track, qr_data, now):
+        """Count one decode for a track and commit its ID once enough decodes agree"""
+        agreed, rejected = track.vote(qr_data, now, self.vote_window, self.vote_min_agree, self.vote_buffer)
+        self._count_misreads(rejected)
+        if agreed and qr_data != track.qr_id:
+            if track.qr_id is not None:
+                self.logger.warning(f"Track {track.track_id}: ID changed from {track.qr_id} to {qr_data}")
+            track.qr_id = qr_data
+            self.ids_confirmed += 1
+            get_metrics().increment('qr_ids_confirmed')
+
+    def _count_misreads(self, rejected):
+        if rejected:
+            self.misreads_rejected += rejected
+            get_metrics().increment('qr_misreads_rejected', rejected)
+
+    def _crop(self, frame, box):
+        """Padded crop of one box, clipped to the frame"""
+        x1, y1, x2, y2 = box
+        h, w, _ = frame.shape
+        pad = self.config.get('crop_padding', 10)
+        crop_y1, crop_y2 = max(0, y1-pad), min(h, y2+pad)
+        crop_x1, crop_x2 = max(0, x1-pad), min(w, x2+pad)
+        return frame[crop_y1:crop_y2, crop_x1:crop_x2]
+
+
+class BatchedDetector:
+    """
+    Pipeline mode for KegDetector: collects submitted frames until batch_size
+    frames are waiting or batch_max_wait_ms has passed, runs them through the
+    model as one batch and resolves each frame's future.
+    Frames are queued per source (camera) and batches are filled round-robin
+    across sources, so one shared model serves several cameras fairly.
+    Used by MultiCameraSystem (more than one entry in MULTI_CAMERA_CONFIG);
+    a single camera pipeline has one frame in flight, so no batch would form.
+    """
+
+    def __init__(self, detector: KegDetector, batch_size=None, max_wait_ms=None):
+        self.detector = detector
+        self.logger = logger
+        self.batch_size = max(1, int(batch_size or DETECTION_CONFIG.get('batch_size', 4)))
+        wait_ms = max_wait_ms if max_wait_ms is not None else DETECTION_CONFIG.get('batch_max_wait_ms', 15)
+        self.max_wait = wait_ms / 1000.0
+        
+        self._queues: Dict[Any, deque] = {}
+        self._order: List[Any] = []   # Round-robin order of sources
+        self._next = 0
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.batches_run = 0
+        self.frames_run = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="BatchedDetector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        # Release anyone still waiting on a frame that will never run
+        with self._cond:
+            for q in self._queues.values():
+                while q:
+                    frame, future = q.popleft()
+                    future.set_result((frame, [], []))
+
+    def submit(self, frame, source=None) -> Future:
+        """Queue a frame from a source; the future resolves to (frame, ids, overlays)"""
+        future = Future()
+        with self._cond:
+            if source not in self._queues:
+                self._queues[source] = deque()
+                self._order.append(source)
+            self._queues[source].append((frame, future))
+            self._cond.notify()
+        return future
+
+    def detect_and_decode(self, frame):
+        """Blocking drop-in for KegDetector.detect_and_decode"""
+        frame, ids, _ = self.submit(frame).result()
+        return frame, ids
+
+    def detect_with_overlays(self, frame):
+        """Blocking drop-in for KegDetector.detect_with_overlays"""
+        return self.submit(frame).result()
+
+    def reset_tracking(self, source=None):
+        self.detector.reset_tracking(source)
+
+    def for_source(self, source) -> 'SourceDetector':
+        """Detector handle for one camera, to give to that camera's controller"""
+        return SourceDetector(self, source)
+
+    def queue_depth(self, source=None) -> int:
+        """Frames of a source waiting for the model"""
+        with self._cond:
+            q = self._queues.get(source)
+            return len(q) if q else 0
+
+    def _has_pending(self) -> bool:
+        return any(self._queues.values())
+
+    def _take_round_robin(self, batch):
+        """Move waiting frames into batch, one source at a time (call with _cond held)"""
+        while len(batch) < self.batch_size:
+            took = False
+            for _ in range(len(self._order)):
+                source = self._order[self._next]
+                self._next = (self._next + 1) % len(self._order)
+                q = self._queues[source]
+                if q:
+                    batch.append((source, *q.popleft()))
+                    took = True
+                    if len(batch) >= self.batch_size:
+                        break
+            if not took:
+                break
+
+    def _collect_batch(self):
+        batch = []
+        with self._cond:
+            if not self._cond.wait_for(self._has_pending, timeout=0.1):
+                return batch
+            self._take_round_robin(batch)
             
-        return annotated_frame, list(detected_ids)
\ No newline at end of file
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait_for(self._has_pending, timeout=remaining):
+                    break
+                self._take_round_robin(batch)
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            
+            sources = [source for source, _, _ in batch]
+            frames = [frame for _, frame, _ in batch]
+            try:
+                results = self.detector.detect_batch(frames, sources)
+            except Exception as e:
+                self.logger.error(f"Batched detection failed: {e}")
+                results = [(frame, [], []) for frame in frames]
+            
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches_run += 1
+            self.frames_run += len(batch)
+
+
+class SourceDetector:
+    """Per-camera view of a shared BatchedDetector; drop-in for KegDetector in a controller"""
+
+    def __init__(self, engine: BatchedDetector, source):
+        self.engine = engine
+        self.source = source
+
+    def detect_and_decode(self, frame):
+        frame, ids, _ = self.detect_with_overlays(frame)
+        return frame, ids
+
+    def detect_with_overlays(self, frame):
+        if frame is None:
+            return frame, [], []
+        return self.engine.submit(frame, self.source).result()
+
+    def reset_tracking(self):
+        self.engine.reset_tracking(self.source)
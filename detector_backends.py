@@ -0,0 +1,170 @@
+# detector_backends.py - Pluggable inference backends for KegDetector
+from pathlib import Path
+from typing import List, Optional
+import cv2
+import numpy as np
+from config import DETECTION_CONFIG, ONNX_MODEL_PATH, QRCODE_MODEL_PATH, logger
+
+
+class DetectorBackend:
+    """
+    Interface for keg detection models.
+    predict() takes a list of BGR frames and returns, per frame, a float32
+    (N, 5) array of [x1, y1, x2, y2, score] in that frame's pixel coordinates.
+    imgsz is the network input size (long side, a multiple of 32) the frames
+    are letterboxed to; None keeps the backend's default.
+    """
+    name = 'base'
+
+    def predict(self, frames, conf: float, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        raise NotImplementedError
+
+
+class UltralyticsBackend(DetectorBackend):
+    """PyTorch model loaded through ultralytics (imports torch, slow to start)"""
+    name = 'ultralytics'
+
+    def __init__(self, model_path):
+        # Imported here so the ONNX backend never pulls in torch
+        from ultralytics import YOLO
+        self.model_path = str(model_path)
+        self.model = YOLO(self.model_path)
+
+    def predict(self, frames, conf: float, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        # Without imgsz ultralytics letterboxes every input to the training size (640)
+        kwargs = {'imgsz': imgsz} if imgsz else {}
+        results = self.model(list(frames), verbose=False, conf=conf, **kwargs)
+        batch = []
+        for result in results:
+            rows = [[*(float(v) for v in box.xyxy[0]), float(box.conf[0])] for box in result.boxes]
+            batch.append(np.asarray(rows, dtype=np.float32).reshape(-1, 5))
+        return batch
+
+
+class OnnxBackend(DetectorBackend):
+    """
+    Exported YOLOv8 model run through onnxruntime on CPU.
+    Export with: yolo export model=model/best.pt format=onnx dynamic=True
+    A dynamic-shape export runs at the imgsz derived from infer_width; a
+    static export always runs at its fixed input size. Set DETECTION_CONFIG['onnx_providers'] to e.g. ['OpenVINOExecutionProvider']
+    when onnxruntime-openvino is installed.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path, providers=None, imgsz=None, nms_iou=None):
+        import onnxruntime as ort
+        self.model_path = str(model_path)
+        self.nms_iou = nms_iou if nms_iou is not None else DETECTION_CONFIG.get('nms_iou', 0.7)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            self.model_path,
+            sess_options=options,
+            providers=providers or DETECTION_CONFIG.get('onnx_providers', ['CPUExecutionProvider'])
+        )
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Static (1, 3, H, W) exports are run frame by frame; dynamic ones take the whole batch
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        h, w = model_input.shape[2], model_input.shape[3]
+        # Dynamic spatial axes follow the imgsz passed to predict()
+        self.dynamic_size = not (isinstance(h, int) and isinstance(w, int))
+        default_size = imgsz or DETECTION_CONFIG.get('onnx_imgsz', 640)
+        self.input_h = h if isinstance(h, int) else default_size
+        self.input_w = w if isinstance(w, int) else default_size
+        if not self.dynamic_size:
+            logger.info(f"ONNX model has a fixed {self.input_w}x{self.input_h} input; infer_width above "
+                        f"{max(self.input_w, self.input_h)} only adds resize cost (export with dynamic=True)")
+
+    def _input_size(self, imgsz):
+        """(height, width) the frames are letterboxed to"""
+        if self.dynamic_size and imgsz:
+            return imgsz, imgsz
+        return self.input_h, self.input_w
+
+    def _letterbox(self, frame, input_h, input_w):
+        """Resize keeping aspect ratio and pad to the model input (ultralytics grey 114 padding)"""
+        h, w = frame.shape[:2]
+        ratio = min(input_h / h, input_w / w)
+        new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+        pad_x, pad_y = (input_w - new_w) / 2, (input_h - new_h) / 2
+
+        resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (w, h) else frame
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        bottom, right = input_h - new_h - top, input_w - new_w - left
+        padded = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return padded, ratio, (left, top)
+
+    def _preprocess(self, frames, imgsz=None):
+        input_h, input_w = self._input_size(imgsz)
+        blobs, transforms = [], []
+        for frame in frames:
+            padded, ratio, pad = self._letterbox(frame, input_h, input_w)
+            # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+            blob = cv2.dnn.blobFromImage(padded, scalefactor=1 / 255.0, swapRB=True)
+            blobs.append(blob)
+            transforms.append((ratio, pad, frame.shape[:2]))
+        return blobs, transforms
+
+    def _postprocess(self, output, conf, transform):
+        """YOLOv8 head output (4 + num_classes, anchors) -> (N, 5) boxes after NMS"""
+        ratio, (pad_x, pad_y), (h, w) = transform
+        preds = output.T
+        scores = preds[:, 4:].max(axis=1)
+        keep = scores >= conf
+        preds, scores = preds[keep], scores[keep]
+        class_ids = preds[:, 4:].argmax(axis=1)
+        if not len(preds):
+            return np.zeros((0, 5), dtype=np.float32)
+
+        cx, cy, bw, bh = preds[:, 0], preds[:, 1], preds[:, 2], preds[:, 3]
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - pad_x) / ratio, 0, w)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - pad_y) / ratio, 0, h)
+
+        # Per-class NMS like ultralytics: offset each class into its own coordinate range
+        offsets = class_ids.astype(np.float32) * (max(w, h) + 1)
+        nms_input = [[float(x1 + o), float(y1 + o), float(x2 - x1), float(y2 - y1)]
+                     for (x1, y1, x2, y2), o in zip(boxes, offsets)]
+        indices = cv2.dnn.NMSBoxes(nms_input, scores.tolist(), conf, self.nms_iou)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+
+        result = np.concatenate([boxes[indices], scores[indices, None]], axis=1)
+        return result[np.argsort(-result[:, 4])].astype(np.float32)
+
+    def predict(self, frames, conf: float, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        if not frames:
+            return []
+        blobs, transforms = self._preprocess(frames, imgsz)
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: np.concatenate(blobs, axis=0)})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: blob})[0] for blob in blobs], axis=0)
+
+        return [self._postprocess(output, conf, transform) for output, transform in zip(outputs, transforms)]
+
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    OnnxBackend.name: OnnxBackend
+}
+
+
+def create_backend(name=None, model_path=None) -> DetectorBackend:
+    """Instantiate the backend selected in DETECTION_CONFIG['backend']"""
+    name = name or DETECTION_CONFIG.get('backend', 'ultralytics')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{name}' (expected one of {sorted(BACKENDS)})")
+
+    if name == OnnxBackend.name:
+        # The controller passes the .pt path; fall back to the exported model next to it
+        path = Path(model_path) if model_path and str(model_path).endswith('.onnx') else ONNX_MODEL_PATH
+    else:
+        path = model_path or QRCODE_MODEL_PATH
+
+    backend = BACKENDS[name](path)
+    logger.info(f"Detector backend '{name}' loaded from: {path}")
+    return backend
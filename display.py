@@ -0,0 +1,73 @@
+# display.py - Frame preparation for the HMI camera view (no Kivy dependency)
+from typing import NamedTuple, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+# BGR colours used for keg boxes
+RESOLVED_COLOR = (0, 255, 0)     # QR decoded (green)
+SEARCHING_COLOR = (0, 165, 255)  # Still looking for a QR (orange)
+
+
+class BoxOverlay(NamedTuple):
+    """One detected keg, in full-resolution frame coordinates"""
+    box: Tuple[int, int, int, int]
+    qr_id: Optional[str]
+
+
+def draw_overlays(image, overlays: Sequence[BoxOverlay], scale_x: float = 1.0, scale_y: float = 1.0):
+    """
+    Draw keg boxes and IDs onto image in place. scale_x / scale_y map frame
+    coordinates to image coordinates, so the drawing can happen on the small
+    display buffer instead of the full frame.
+    """
+    # Keep line weight proportional: 3 px / 2 px at 1080p, at least 1 px
+    weight = max(scale_x, scale_y)
+    for (x1, y1, x2, y2), qr_id in overlays:
+        p1 = (int(x1 * scale_x), int(y1 * scale_y))
+        p2 = (int(x2 * scale_x), int(y2 * scale_y))
+        if qr_id:
+            cv2.rectangle(image, p1, p2, RESOLVED_COLOR, max(1, int(round(3 * weight))))
+            cv2.putText(image, qr_id, (p1[0], p1[1] - max(2, int(10 * weight))),
+                        cv2.FONT_HERSHEY_SIMPLEX, max(0.35, 0.6 * weight), RESOLVED_COLOR, max(1, int(round(2 * weight))))
+        else:
+            cv2.rectangle(image, p1, p2, SEARCHING_COLOR, max(1, int(round(2 * weight))))
+    return image
+
+
+def fit_to_size(frame, max_width: int, max_height: int):
+    """
+    Downscale a frame to fit max_width x max_height, keeping its aspect ratio.
+    Never upscales. The width is rounded down to a multiple of 4 so BGR rows
+    stay 4-byte aligned for the GL texture upload.
+    """
+    h, w = frame.shape[:2]
+    if max_width <= 0 or max_height <= 0:
+        return frame
+
+    scale = min(max_width / w, max_height / h)
+    if scale >= 1.0:
+        return frame
+
+    new_w = max(4, int(w * scale) // 4 * 4)
+    new_h = max(1, int(round(h * new_w / w)))
+    # INTER_LINEAR: ~1 ms at 1080p vs ~17 ms for INTER_AREA at non-integer scales; fine for a preview
+    return cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+
+def render_for_display(frame, overlays: Sequence[BoxOverlay], max_width: int = 0, max_height: int = 0):
+    """
+    Fit the raw frame to the display and draw the overlays at that resolution.
+    Never modifies the input frame.
+    """
+    image = fit_to_size(frame, max_width, max_height) if max_width and max_height else frame
+    if not overlays:
+        return image
+    if image is frame:
+        image = frame.copy()
+    h, w = frame.shape[:2]
+    return draw_overlays(image, overlays, image.shape[1] / w, image.shape[0] / h)
+
+
+def as_upload_buffer(frame):
+    """Flat view of the pixels for Texture.blit_buffer (copies only if not contiguous)"""
+    return memoryview(np.ascontiguousarray(frame).reshape(-1))
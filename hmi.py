@@ -1,23 +1,28 @@
 # hmi.py
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.spinner import Spinner
 from kivy.uix.image import Image
-from kivy.uix.scrollview import ScrollView 
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.metrics import dp
 from kivy.graphics.texture import Texture
 from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.uix.modalview import ModalView
 from kivy.app import App
-import cv2
 import json
 import os
+from display import render_for_display, as_upload_buffer
+from metrics import get_metrics
+from startup import get_startup_timer
 
 # Try to import logger, otherwise use standard print
 try:
-    from config import COLOR_SCHEME, logger
+    from config import COLOR_SCHEME, DISPLAY_CONFIG, METRICS_CONFIG, logger
 except ImportError:
     import logging
     logging.basicConfig(level=logging.INFO)
@@ -89,30 +94,143 @@ class LocationConfirmPopup(ModalView):
             self.cancel_callback()
         self.dismiss()
 
+
+class DispatchReviewPopup(ModalView):
+    """Asks the operator whether a dispatch the outbox could not confirm reached the cloud"""
+    def __init__(self, review, resolve_callback, **kwargs):
+        super().__init__(**kwargs)
+        self.review = review
+        self.resolve_callback = resolve_callback
+        self.size_hint = (None, None)
+        self.size = (560, 380)
+        self.auto_dismiss = False
+        self.background_color = (0, 0, 0, 0.9)
+
+        layout = BoxLayout(orientation='vertical', padding=20, spacing=15)
+
+        layout.add_widget(Label(
+            text="DISPATCH UNCONFIRMED", font_size='24sp', color=(1, 0.65, 0, 1),
+            bold=True, size_hint_y=None, height=50
+        ))
+
+        kegs = len(review.get('payload', {}).get('keg_ids', []))
+        msg = (f"Pallet [b]{review.get('pallet_id')}[/b] ({kegs} kegs)\n"
+               f"{review.get('last_error') or 'Interrupted while sending'}\n\n"
+               "Check the cloud: did this pallet arrive?")
+        layout.add_widget(Label(text=msg, font_size='18sp', halign='center', markup=True))
+
+        btn_layout = BoxLayout(orientation='horizontal', spacing=15, size_hint_y=None, height=70)
+
+        btn_later = Button(text="LATER", background_color=(0.5, 0.5, 0.5, 1), bold=True, font_size='18sp')
+        btn_later.bind(on_release=lambda x: self.dismiss())
+        btn_layout.add_widget(btn_later)
+
+        btn_resend = Button(text="NOT THERE - RESEND", background_color=(1, 0.65, 0.3, 1), bold=True, font_size='18sp')
+        btn_resend.bind(on_release=lambda x: self._resolve(True))
+        btn_layout.add_widget(btn_resend)
+
+        btn_arrived = Button(text="ARRIVED", background_color=(0, 0.8, 0, 1), bold=True, font_size='18sp')
+        btn_arrived.bind(on_release=lambda x: self._resolve(False))
+        btn_layout.add_widget(btn_arrived)
+
+        layout.add_widget(btn_layout)
+        self.add_widget(layout)
+
+    def _resolve(self, resend):
+        self.dismiss()
+        if self.resolve_callback:
+            self.resolve_callback(self.review, resend)
+
+# =========================================================
+class ScannedIdList(RecycleView):
+    """Recycled list of scanned keg IDs: only the visible rows have widgets"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = 'Label'
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            default_size=(None, dp(20)),
+            default_size_hint=(1, None)
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.set_ids([])
+
+    def set_ids(self, ids):
+        rows = ids if ids else ["Waiting..."]
+        self.data = [{'text': kid, 'font_size': '13sp', 'color': (0.2, 0.2, 0.2, 1)} for kid in rows]
+
 # =========================================================
 # 3. MAIN HMI CLASS (COMPACT & RESPONSIVE)
 # =========================================================
 class ProfessionalTopCameraHMI(BoxLayout):
-    def __init__(self, top_camera, controller, **kwargs):
+    def __init__(self, top_camera=None, controller=None, pipeline=None, **kwargs):
         super().__init__(**kwargs)
-        self.top_camera = top_camera
-        self.controller = controller
+        # Filled in by attach_controller() / attach_pipeline() as startup stages finish
+        self.top_camera = None
+        self.controller = None
+        self.pipeline = None
         self.orientation = 'horizontal'
         
         self.customer_map = {} 
         # self.current_target = 0 
         self.last_count_seen = -1 
+        self.last_result_seq = 0
+        self.shown_scanned_version = -1
+        self._camera_texture = None  # Reused while the display resolution stays the same
         self.ignore_camera_updates = False
         self.confirmed_location = None 
         self.current_popup = None
+        self.review_popup = None
         
         print("[INIT] HMI Initializing...")
         self._build_ui()
+        self._set_loading_state()
         # self._load_last_target() # Removed
         
-        Clock.schedule_once(lambda dt: self._trigger_refresh_logic(), 1)
+        if controller is not None:
+            self.attach_controller(controller)
+        if pipeline is not None:
+            self.attach_pipeline(top_camera, pipeline)
         Clock.schedule_interval(self._update_camera_feed, 1.0 / 30.0)
 
+    def _set_loading_state(self):
+        """Shown until the controller is attached: nothing that needs it can be pressed"""
+        self.status_label.text = "Loading..."
+        self.status_label.color = (0.5, 0.5, 0.5, 1)
+        for widget in (self.customer_spinner, self.refresh_btn, self.reset_btn):
+            widget.disabled = True
+        self._update_notification("Starting up...", (0.5, 0.5, 0.5, 1))
+
+    def attach_controller(self, controller):
+        """Late-bind the controller once the database is up (UI thread)"""
+        self.controller = controller
+        # Dispatch results arrive from the outbox worker thread
+        if self.controller.outbox is not None:
+            self.controller.outbox.add_listener(self.on_dispatch_result)
+            # Dispatches left unconfirmed by a previous run
+            self._refresh_reviews()
+        for widget in (self.customer_spinner, self.refresh_btn, self.reset_btn):
+            widget.disabled = False
+        self.status_label.text = "Starting camera..."
+        
+        # Fill the spinner from the local cache right away; refresh from the cloud in the background
+        self._load_customers_at_boot()
+
+    def attach_pipeline(self, top_camera, pipeline):
+        """Late-bind the running capture -> detect pipeline (UI thread)"""
+        self.top_camera = top_camera
+        self.pipeline = pipeline
+        self.status_label.text = "Live Count"
+        self.status_label.color = (1, 0.65, 0, 1)
+        self._update_notification("Ready", (0.4, 0.7, 0.4, 1))
+
+    def show_startup_error(self, message):
+        self.status_label.text = "Startup failed"
+        self.status_label.color = (0.9, 0.1, 0.1, 1)
+        self._update_notification(message, (0.9, 0.1, 0.1, 1))
+
     # def _load_last_target(self): ... REMOVED
     # def _save_target_to_disk(self): ... REMOVED
 
@@ -125,9 +243,18 @@ class ProfessionalTopCameraHMI(BoxLayout):
         self.padding = 5
         
         # === LEFT PANEL (Camera - Takes 65% of width) ===
-        left_panel = BoxLayout(orientation='vertical', size_hint_x=0.65)
-        self.camera_image = Image(allow_stretch=True, keep_ratio=True)
+        left_panel = FloatLayout(size_hint_x=0.65)
+        self.camera_image = Image(allow_stretch=True, keep_ratio=True, pos_hint={'x': 0, 'y': 0})
         left_panel.add_widget(self.camera_image)
+        
+        # Hidden latency overlay: double-tap the camera view (or press M) to toggle
+        self.metrics_label = Label(text='', font_size='11sp', color=(1, 1, 1, 1), halign='left', valign='top',
+                                   size_hint=(1, 0.5), pos_hint={'x': 0.02, 'top': 0.98}, opacity=0)
+        self.metrics_label.bind(size=self.metrics_label.setter('text_size'))
+        self._metrics_event = None
+        left_panel.add_widget(self.metrics_label)
+        self.camera_image.bind(on_touch_down=self._on_camera_touch)
+        Window.bind(on_key_down=self._on_key_down)
         self.add_widget(left_panel)
         
         # === RIGHT PANEL (Controls - Takes 35% of width) ===
@@ -137,6 +264,12 @@ class ProfessionalTopCameraHMI(BoxLayout):
         header = BoxLayout(size_hint_y=0.1) 
         header.add_widget(Label(text='[b]PALLETIZER[/b]', markup=True, color=(0.2, 0.4, 0.7, 1), font_size='18sp', halign='left', valign='middle'))
         
+        # Shown while dispatches wait for an operator decision (see DispatchReviewPopup)
+        self.review_btn = Button(text='', background_color=(1, 0.65, 0, 1), size_hint_x=None, width=0,
+                                 opacity=0, disabled=True, font_size='14sp', bold=True)
+        self.review_btn.bind(on_release=lambda x: self._show_next_review())
+        header.add_widget(self.review_btn)
+        
         exit_btn = Button(text='X', background_color=(0.9, 0.1, 0.1, 1), size_hint_x=None, width=40, font_size='16sp', bold=True)
         exit_btn.bind(on_release=lambda x: App.get_running_app().stop())
         header.add_widget(exit_btn)
@@ -173,24 +306,12 @@ class ProfessionalTopCameraHMI(BoxLayout):
         cust_row.add_widget(self.refresh_btn)
         right_panel.add_widget(cust_row)
 
-        # 4. Scanned List (Compact ScrollView)
+        # 4. Scanned List (Recycled list view)
         list_container = BoxLayout(orientation='vertical', size_hint_y=0.35) 
         list_container.add_widget(Label(text='Scanned IDs:', size_hint_y=None, height=20, color=(0.5, 0.5, 0.5, 1)))
         
-        self.id_scroll = ScrollView()
-        self.id_label = Label(
-            text='Waiting...', 
-            font_size='13sp', 
-            color=(0.2, 0.2, 0.2, 1),
-            size_hint_y=None, 
-            halign='center', 
-            valign='top'
-        )
-        self.id_label.bind(texture_size=self.id_label.setter('size'))
-        self.id_label.bind(width=lambda *x: self.id_label.setter('text_size')(self.id_label, (self.id_label.width, None)))
-        
-        self.id_scroll.add_widget(self.id_label)
-        list_container.add_widget(self.id_scroll)
+        self.id_list = ScannedIdList()
+        list_container.add_widget(self.id_list)
         right_panel.add_widget(list_container)
 
         # 5. Control Buttons (Grid Layout)
@@ -247,7 +368,7 @@ class ProfessionalTopCameraHMI(BoxLayout):
         loc_text = data.get('location', 'Unknown')
         self.confirmed_location = loc_text
         self._update_notification(f"Loc: {loc_text}", (0, 1, 0, 1))
-        self._update_submit_button(len(self.controller.scanned_kegs))
+        self._update_submit_button(len(self.controller.scanned_kegs) if self.controller else 0)
 
         # Auto-submit if ready (User requested auto-click behavior)
         if not self.submit_btn.disabled:
@@ -270,16 +391,35 @@ class ProfessionalTopCameraHMI(BoxLayout):
         self._update_notification("Refreshing...", (0.2, 0.6, 1.0, 1))
         Clock.schedule_once(lambda dt: self._trigger_refresh_logic(), 0.1)
 
-    def _trigger_refresh_logic(self):
-        customers = self.controller.get_customers()
+    def _load_customers_at_boot(self):
+        customers, fresh = self.controller.get_cached_customers()
         if customers:
-            self.customer_map = {c['name']: c['id'] for c in customers}
-            self.customer_spinner.values = list(self.customer_map.keys())
-            if self.customer_spinner.text not in self.customer_map:
-                self.customer_spinner.text = 'Select Customer'
-            self._update_notification("Data Updated", (0.3, 0.75, 0.5, 1))
-        else:
+            self._apply_customers(customers)
+        if not fresh:
+            self._trigger_refresh_logic()
+
+    def _trigger_refresh_logic(self):
+        # Network fetch runs on a worker thread; results come back via _on_customers_refreshed
+        self.controller.refresh_customers_async(self._on_customers_refreshed)
+
+    def _on_customers_refreshed(self, customers, changed):
+        Clock.schedule_once(lambda dt: self._finish_customer_refresh(customers, changed), 0)
+
+    def _finish_customer_refresh(self, customers, changed):
+        if customers is None:
             self._update_notification("API Error", (0.9, 0.3, 0.3, 1))
+            return
+        # An unchanged list leaves the spinner alone
+        if changed or not self.customer_map:
+            self._apply_customers(customers)
+        self._update_notification("Data Updated", (0.3, 0.75, 0.5, 1))
+
+    def _apply_customers(self, customers):
+        get_startup_timer().mark('customers_loaded')
+        self.customer_map = {c['name']: c['id'] for c in customers}
+        self.customer_spinner.values = list(self.customer_map.keys())
+        if self.customer_spinner.text not in self.customer_map:
+            self.customer_spinner.text = 'Select Customer'
 
         c_name = self.customer_spinner.text
         if c_name in self.customer_map:
@@ -308,7 +448,7 @@ class ProfessionalTopCameraHMI(BoxLayout):
             # self._save_target_to_disk()
             
             self.status_label.text = "Live Count"
-            self.id_label.text = "Waiting..."
+            self.id_list.set_ids([])
             self._update_submit_button(0)
             # self.save_btn.disabled = True
             # self.save_btn.background_color = (0.75, 0.75, 0.75, 1)
@@ -335,9 +475,9 @@ class ProfessionalTopCameraHMI(BoxLayout):
         if result['success']:
             self.controller.reset_session()
             c_id = self.customer_map.get(self.customer_spinner.text)
-            if c_id: self.controller.set_target_and_customer(c_id)
+            if c_id: self.controller.set_customer(c_id)
             
-            self.id_label.text = "Waiting..."
+            self.id_list.set_ids([])
             self.submit_btn.text = "SUBMIT TO CLOUD"
             # self.save_btn.disabled = True
             
@@ -346,40 +486,165 @@ class ProfessionalTopCameraHMI(BoxLayout):
             self.status_label.color = (1, 0.65, 0, 1)
             
             self._update_submit_button(0)
-            self._update_notification("Success!", (0.3, 0.75, 0.5, 1))
+            if result.get('queued'):
+                self._update_notification("Queued for Cloud", (0.2, 0.6, 1.0, 1))
+            else:
+                self._update_notification("Success!", (0.3, 0.75, 0.5, 1))
         else:
             self._update_notification("Failed", (0.95, 0.4, 0.35, 1))
             self.submit_btn.disabled = False 
             self.submit_btn.text = "SUBMIT TO CLOUD"
 
+    def on_dispatch_result(self, event):
+        """Outbox listener (worker thread): hop to the UI thread before touching widgets"""
+        Clock.schedule_once(lambda dt: self._show_dispatch_result(event), 0)
+
+    def _show_dispatch_result(self, event):
+        pallet_id = event.get('pallet_id')
+        status = event.get('status')
+        if status == 'sent':
+            self._update_notification("Success!", (0.3, 0.75, 0.5, 1))
+        elif status == 'retrying':
+            self._update_notification(f"Retrying #{event.get('attempts')}...", (1, 0.65, 0, 1))
+        elif status == 'review':
+            logger.error(f"Dispatch unconfirmed for {pallet_id}: {event.get('error')}")
+            self._update_notification("Unconfirmed - check cloud", (1, 0.65, 0, 1))
+            self._refresh_reviews()
+            self._show_next_review()
+        else:
+            logger.error(f"Dispatch failed for {pallet_id}: {event.get('error')}")
+            self._update_notification("Failed", (0.95, 0.4, 0.35, 1))
+
+    def _refresh_reviews(self):
+        """Show the review button with the number of dispatches held for review"""
+        outbox = self.controller.outbox if self.controller else None
+        count = len(outbox.get_reviews()) if outbox is not None else 0
+        self.review_btn.text = f"! {count}" if count else ''
+        self.review_btn.width = 50 if count else 0
+        self.review_btn.opacity = 1 if count else 0
+        self.review_btn.disabled = not count
+        return count
+
+    def _show_next_review(self):
+        if self.review_popup is not None or not self.controller or self.controller.outbox is None:
+            return
+        reviews = self.controller.outbox.get_reviews()
+        if not reviews:
+            return
+        self.review_popup = DispatchReviewPopup(reviews[0], self._on_review_resolved)
+        self.review_popup.bind(on_dismiss=self._on_review_dismissed)
+        self.review_popup.open()
+
+    def _on_review_dismissed(self, popup):
+        self.review_popup = None
+        self._refresh_reviews()
+
+    def _on_review_resolved(self, review, resend):
+        if not self.controller.outbox.resolve_review(review['id'], resend):
+            self._update_notification("Review already resolved", (0.5, 0.5, 0.5, 1))
+        elif resend:
+            self._update_notification("Resending...", (0.2, 0.6, 1.0, 1))
+        else:
+            self._update_notification("Marked as arrived", (0.3, 0.75, 0.5, 1))
+        # Work through the remaining ones
+        if self._refresh_reviews():
+            Clock.schedule_once(lambda dt: self._show_next_review(), 0)
+
+    def _on_camera_touch(self, widget, touch):
+        if widget.collide_point(*touch.pos) and touch.is_double_tap:
+            self.toggle_metrics_overlay()
+            return True
+        return False
+
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if codepoint in ('m', 'M'):
+            self.toggle_metrics_overlay()
+            return True
+        return False
+
+    def toggle_metrics_overlay(self):
+        if self._metrics_event is None:
+            self.metrics_label.opacity = 1
+            self._refresh_metrics_overlay(0)
+            self._metrics_event = Clock.schedule_interval(self._refresh_metrics_overlay,
+                                                          METRICS_CONFIG.get('overlay_interval', 1.0))
+        else:
+            self._metrics_event.cancel()
+            self._metrics_event = None
+            self.metrics_label.opacity = 0
+
+    def _refresh_metrics_overlay(self, dt):
+        metrics = get_metrics()
+        lines = [f"detect {self.pipeline.detection_rate:.1f}/s" if self.pipeline else "pipeline starting"]
+        if not metrics.enabled:
+            lines.append("latency metrics disabled (METRICS_CONFIG)")
+        for name, stats in metrics.snapshot().items():
+            lines.append(f"{name}: {stats['p50'] * 1000:.1f} / {stats['p95'] * 1000:.1f} / "
+                         f"{stats['p99'] * 1000:.1f} ms (n={stats['count']})")
+        for name, value in metrics.counters().items():
+            lines.append(f"{name}: {value}")
+        self.metrics_label.text = "\n".join(lines)
+
     def _update_camera_feed(self, dt):
-        if self.top_camera.is_active:
-            ret, frame = self.top_camera.get_overhead_view()
-            if ret and frame is not None:
-                processed, count, reached = self.controller.process_frame(frame)
-                
-                if not self.ignore_camera_updates:
-                    # Update count display directly
-                    self.count_display_label.text = str(count)
-                    self.status_label.text = "Live Count"
-                    self.status_label.color = (1, 0.65, 0, 1)
-                    
-                    scanned_list = self.controller.get_scanned_list()
-                    self.id_label.text = "\n".join(scanned_list) if scanned_list else "Waiting..."
-                    
-                    self._update_submit_button(count)
-                    
-                    # if count > 0:
-                    #     self.save_btn.disabled = False
-                    #     self.save_btn.background_color = (0.2, 0.6, 1.0, 1)
-                    # else:
-                    #     self.save_btn.disabled = True
-                    #     self.save_btn.background_color = (0.75, 0.75, 0.75, 1)
-
-                buf = cv2.flip(processed, 0).tobytes()
-                texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-                texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-                self.camera_image.texture = texture
+        # Detection runs on the pipeline worker; only pick up its newest result here
+        if self.pipeline is None:
+            return
+        result = self.pipeline.get_latest()
+        if result is None or result.seq == self.last_result_seq:
+            return
+        self.last_result_seq = result.seq
+        with get_metrics().timer('hmi_update_camera_feed'):
+            self._apply_result(result)
+
+    def _apply_result(self, result):
+        processed, count = result.frame, result.count
+        
+        if not self.ignore_camera_updates:
+            # Update count display directly
+            self.count_display_label.text = str(count)
+            self.status_label.text = "Live Count"
+            self.status_label.color = (1, 0.65, 0, 1)
+            
+            # Only rebuild the list when the controller reports a change
+            if self.controller.scanned_version != self.shown_scanned_version:
+                version, scanned_list = self.controller.get_scanned_snapshot()
+                self.id_list.set_ids(scanned_list)
+                self.shown_scanned_version = version
+            
+            self._update_submit_button(count)
+            
+            # if count > 0:
+            #     self.save_btn.disabled = False
+            #     self.save_btn.background_color = (0.2, 0.6, 1.0, 1)
+            # else:
+            #     self.save_btn.disabled = True
+            #     self.save_btn.background_color = (0.75, 0.75, 0.75, 1)
+
+        self._show_frame(processed, result.overlays)
+        startup = get_startup_timer()
+        startup.mark('first_frame_shown')
+        if startup.elapsed('first_detection') is not None:
+            startup.mark('first_detection_shown')
+
+    def _show_frame(self, frame, overlays=()):
+        """Upload a BGR frame into the camera texture, allocating it only when the size changes"""
+        # Boxes are drawn here, on the display-sized buffer, and only for frames actually shown
+        if DISPLAY_CONFIG.get('fit_to_widget', True):
+            frame = render_for_display(frame, overlays, int(self.camera_image.width), int(self.camera_image.height))
+        else:
+            frame = render_for_display(frame, overlays)
+        
+        h, w = frame.shape[:2]
+        texture = self._camera_texture
+        if texture is None or texture.size != (w, h):
+            texture = Texture.create(size=(w, h), colorfmt='bgr')
+            # OpenCV rows run top-down: flip through texture coordinates, not by copying pixels
+            texture.flip_vertical()
+            self._camera_texture = texture
+            self.camera_image.texture = texture
+        
+        texture.blit_buffer(as_upload_buffer(frame), colorfmt='bgr', bufferfmt='ubyte')
+        self.camera_image.canvas.ask_update()
 
     def _update_submit_button(self, count):
         customer_selected = self.customer_spinner.text in self.customer_map
@@ -0,0 +1,187 @@
+# metrics.py - Hot-path latency instrumentation and Prometheus text endpoint
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+import numpy as np
+from config import METRICS_CONFIG, logger
+
+
+class LatencyHistogram:
+    """Rolling window of the most recent samples (seconds) plus lifetime count/sum"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        # deque.append is atomic, so recording needs no lock
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentiles(self, pcts=(50, 95, 99)) -> Dict[int, float]:
+        samples = list(self.samples)
+        if not samples:
+            return {p: 0.0 for p in pcts}
+        values = np.percentile(samples, pcts)
+        return {p: float(v) for p, v in zip(pcts, values)}
+
+
+class _NullTimer:
+    """Returned when metrics are disabled: entering and leaving it does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named latency histograms for the capture -> detect -> store -> display path"""
+
+    def __init__(self, enabled=None, window=None):
+        self.enabled = METRICS_CONFIG.get('enabled', False) if enabled is None else enabled
+        self.window = window or METRICS_CONFIG.get('window', 1024)
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram(self.window))
+        return histogram
+
+    def timer(self, name: str):
+        """Context manager timing a block with a monotonic clock (no-op when disabled)"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self._histogram(name))
+
+    def observe(self, name: str, seconds: float):
+        if self.enabled:
+            self._histogram(name).observe(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        """Add to an event counter (no-op when disabled)"""
+        if self.enabled and amount:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def reset(self):
+        """Drop all samples and counters (e.g. between benchmark runs)"""
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def _histogram_items(self):
+        # Worker threads add stages concurrently; iterate over a copy taken under the lock
+        with self._lock:
+            return sorted(self._histograms.items())
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """{stage: {'count', 'p50', 'p95', 'p99'}} with latencies in seconds"""
+        result = {}
+        for name, histogram in self._histogram_items():
+            pct = histogram.percentiles()
+            result[name] = {'count': histogram.count, 'p50': pct[50], 'p95': pct[95], 'p99': pct[99]}
+        return result
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP topcam_stage_latency_seconds Latency of pipeline stages (rolling window quantiles)",
+            "# TYPE topcam_stage_latency_seconds summary"
+        ]
+        for name, histogram in self._histogram_items():
+            for pct, value in histogram.percentiles().items():
+                lines.append(f'topcam_stage_latency_seconds{{stage="{name}",quantile="{pct / 100}"}} {value:.6f}')
+            lines.append(f'topcam_stage_latency_seconds_sum{{stage="{name}"}} {histogram.total:.6f}')
+            lines.append(f'topcam_stage_latency_seconds_count{{stage="{name}"}} {histogram.count}')
+        lines += [
+            "# HELP topcam_events_total Pipeline event counters",
+            "# TYPE topcam_events_total counter"
+        ]
+        for name, value in self.counters().items():
+            lines.append(f'topcam_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves GET /metrics in Prometheus text format on a local port"""
+
+    def __init__(self, registry: MetricsRegistry, host=None, port=None):
+        self.registry = registry
+        self.host = host or METRICS_CONFIG.get('http_host', '127.0.0.1')
+        self.port = port if port is not None else METRICS_CONFIG.get('http_port', 9109)
+        self._server = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.error(f"Metrics endpoint could not bind {self.host}:{self.port}: {e}")
+            return False
+        threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True).start()
+        logger.info(f"Metrics endpoint at http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Singleton instance
+_metrics_instance = None
+
+def get_metrics() -> MetricsRegistry:
+    global _metrics_instance
+    if _metrics_instance is None:
+        _metrics_instance = MetricsRegistry()
+    return _metrics_instance
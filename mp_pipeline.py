@@ -0,0 +1,432 @@
+# mp_pipeline.py - Multi-process Capture -> Detect Pipeline over shared memory
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Optional
+import cv2
+import numpy as np
+from config import PIPELINE_CONFIG, TOP_CAMERA_CONFIG, QRCODE_MODEL_PATH, logger
+from metrics import get_metrics
+from pipeline import DetectionResult
+from startup import get_startup_timer
+
+# Per-slot header fields (int64)
+_SEQ, _PINS, _HEIGHT, _WIDTH = range(4)
+_ALIGN = 64
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SharedFrameRing:
+    """
+    Fixed set of BGR frame slots in one shared memory block.
+    Each slot has a header (seq, pin count, height, width) and a capture
+    timestamp; the pixels of a frame are stored contiguously at the start of
+    its slot, so readers get a plain ndarray view with no copy. The writer
+    only takes slots nobody has pinned, and marks a slot seq=-1 while
+    filling it, so a reader can never pin a half-written frame. The lock is
+    held only for that bookkeeping, never while pixels are copied.
+    """
+
+    def __init__(self, max_shape, slots: int, lock, name: Optional[str] = None):
+        self.max_shape = tuple(int(v) for v in max_shape)
+        self.slots = int(slots)
+        self.lock = lock
+        self.slot_bytes = _aligned(int(np.prod(self.max_shape)))
+        header_bytes = _aligned(self.slots * 4 * 8)
+        stamps_bytes = _aligned(self.slots * 8)
+        size = header_bytes + stamps_bytes + self.slots * self.slot_bytes
+
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name = self.shm.name
+        self.header = np.ndarray((self.slots, 4), dtype=np.int64, buffer=self.shm.buf)
+        self.stamps = np.ndarray((self.slots,), dtype=np.float64, buffer=self.shm.buf, offset=header_bytes)
+        self._data_offset = header_bytes + stamps_bytes
+        if self.owner:
+            self.header[:] = 0
+            self.header[:, _SEQ] = -1
+            self.stamps[:] = 0.0
+        self._last_written = -1
+        self._last_shape = None
+
+    @property
+    def spec(self):
+        """Picklable description for attach() in another process"""
+        return self.name, self.max_shape, self.slots, self.lock
+
+    @classmethod
+    def attach(cls, spec) -> 'SharedFrameRing':
+        name, max_shape, slots, lock = spec
+        return cls(max_shape, slots, lock, name=name)
+
+    def _slot_view(self, slot: int, shape):
+        offset = self._data_offset + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def view(self, slot: int):
+        """Zero-copy view of the frame in a slot (only stable while the slot is pinned)"""
+        h, w = self.header[slot, _HEIGHT], self.header[slot, _WIDTH]
+        return self._slot_view(slot, (int(h), int(w), self.max_shape[2]))
+
+    def stamp(self, slot: int) -> float:
+        return float(self.stamps[slot])
+
+    # ---- writer side (capture process) ----
+
+    def begin_write(self) -> Optional[int]:
+        """Claim the next unpinned slot for writing, or None if every slot is pinned"""
+        with self.lock:
+            for i in range(1, self.slots + 1):
+                slot = (self._last_written + i) % self.slots
+                if self.header[slot, _PINS] == 0:
+                    self.header[slot, _SEQ] = -1
+                    self._last_written = slot
+                    return slot
+        return None
+
+    def write_buffer(self, slot: int):
+        """Buffer for the camera to read into, sized like the previous frame (None before the first)"""
+        if self._last_shape is None:
+            return None
+        return self._slot_view(slot, self._last_shape)
+
+    def publish(self, slot: int, seq: int, frame, stamp: float):
+        """Make a filled slot visible to readers; copies `frame` in unless it was read in place"""
+        h, w = frame.shape[:2]
+        max_h, max_w = self.max_shape[:2]
+        if h > max_h or w > max_w:
+            # Larger than the ring was sized for: scale down to fit
+            scale = min(max_h / h, max_w / w)
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            h, w = frame.shape[:2]
+        target = self._slot_view(slot, frame.shape)
+        if frame.ctypes.data != target.ctypes.data:
+            np.copyto(target, frame)
+        self._last_shape = target.shape
+        self.header[slot, _HEIGHT] = h
+        self.header[slot, _WIDTH] = w
+        self.stamps[slot] = stamp
+        with self.lock:
+            self.header[slot, _SEQ] = seq
+
+    # ---- reader side ----
+
+    def claim(self, slot: int, seq: int) -> bool:
+        """Pin a slot if it still holds frame `seq` (False once the writer has reused it)"""
+        with self.lock:
+            if self.header[slot, _SEQ] != seq:
+                return False
+            self.header[slot, _PINS] += 1
+            return True
+
+    def release(self, slot: int):
+        with self.lock:
+            if self.header[slot, _PINS] > 0:
+                self.header[slot, _PINS] -= 1
+
+    def close(self):
+        # Views into the buffer must go before the mapping can be closed
+        self.header = self.stamps = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still referenced (e.g. by the HMI); the mapping goes with it
+            logger.debug("Shared frame ring still referenced at close")
+
+    def unlink(self):
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _put_latest(q, item) -> int:
+    """Put on a bounded multiprocessing queue, discarding the oldest items; returns how many"""
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+def _capture_worker(ring_spec, frame_queue, stop_event, counters, camera_config, replay_source, realtime):
+    """Capture process: reads camera frames into ring slots and queues (seq, slot)"""
+    from camera import TopCameraManager
+
+    ring = SharedFrameRing.attach(ring_spec)
+    # Frames go straight into the ring, so the in-process grabber thread is not needed
+    camera = TopCameraManager(replay_source=replay_source, realtime=realtime,
+                              camera_config={**(camera_config or {}), 'threaded_grab': False})
+    camera.start()
+    retry_delay = PIPELINE_CONFIG.get('read_retry_delay', 0.01)
+    frames_captured, frames_dropped = counters
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            if not camera.is_active:
+                stop_event.wait(retry_delay)
+                continue
+
+            slot = ring.begin_write()
+            if slot is None:
+                # Every slot is in use downstream; skip this frame
+                frames_dropped.value += 1
+                stop_event.wait(retry_delay)
+                continue
+
+            ret, frame = camera.get_overhead_view(ring.write_buffer(slot))
+            if not ret or frame is None:
+                stop_event.wait(retry_delay)
+                continue
+
+            try:
+                ring.publish(slot, seq + 1, frame, time.monotonic())
+            except Exception as e:
+                # A bad frame must not take the capture process down; the slot stays unpublished
+                logger.error(f"Capture process error: {e}")
+                frames_dropped.value += 1
+                stop_event.wait(retry_delay)
+                continue
+            seq += 1
+            frames_captured.value += 1
+            frames_dropped.value += _put_latest(frame_queue, (seq, slot))
+    finally:
+        camera.stop()
+        ring.close()
+
+
+def _detect_worker(ring_spec, frame_queue, result_queue, stop_event, session, model_path, backend):
+    """
+    Detection process: runs the scheduler, YOLO and QR decode on ring slots.
+    Results carry only the slot, IDs and box overlays; the pinned slot is
+    handed to the parent, which releases it once the frame is no longer shown.
+    """
+    from detector import KegDetector
+    from scheduler import DetectionScheduler
+
+    ring = SharedFrameRing.attach(ring_spec)
+    scheduler = DetectionScheduler()
+    loaded = {}
+
+    def load_model():
+        try:
+            detector = KegDetector(model_path=model_path, backend=backend)
+            # Ring slots are shared read-only; boxes are drawn by the HMI at display size
+            detector.overlay_mode = True
+            loaded['detector'] = detector
+            result_queue.put(('ready',))
+        except Exception as e:
+            result_queue.put(('error', f"Model load failed: {e}"))
+
+    # Frames pass through undetected while the model loads, as in the threaded pipeline
+    threading.Thread(target=load_model, name="ModelLoad", daemon=True).start()
+    tracked_session = session.value
+    last_overlays = ()
+    try:
+        while not stop_event.is_set():
+            try:
+                seq, slot = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if not ring.claim(slot, seq):
+                continue
+            frame = ring.view(slot)
+
+            detector = loaded.get('detector')
+            ids, overlays, detected, skipped = [], (), False, False
+            if detector is not None:
+                if session.value != tracked_session:
+                    tracked_session = session.value
+                    detector.reset_tracking()
+                    last_overlays = ()
+                if not scheduler.should_run(frame):
+                    # Unchanged scene: the frame is still shown, with the last boxes
+                    overlays, skipped = last_overlays, True
+                else:
+                    start = time.perf_counter()
+                    try:
+                        _, ids, overlays = detector.detect_with_overlays(frame)
+                        overlays = last_overlays = tuple(overlays)
+                        detected = True
+                    except Exception as e:
+                        logger.error(f"Detection process error: {e}")
+                    finally:
+                        scheduler.record_run(time.perf_counter() - start)
+
+            result_queue.put(('result', seq, slot, tracked_session, list(ids), overlays,
+                              detected, skipped, scheduler.effective_rate))
+    finally:
+        ring.close()
+
+
+class _RemoteTracking:
+    """Stands in for the detector in the controller: tracking lives in the detection process"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def reset_tracking(self, source=None):
+        # The detection process resets its tracker when it sees a new session number
+        with self.session.get_lock():
+            self.session.value += 1
+
+
+class ProcessDetectionPipeline:
+    """
+    DetectionPipeline with capture and detection in their own processes, so
+    camera reads, YOLO, pyzbar and the Kivy UI no longer share one GIL.
+    Frames live in a SharedFrameRing; the queues between processes carry
+    only (seq, slot) and the decoded IDs. The HMI gets DetectionResults whose
+    frame is a view of a ring slot, kept pinned while it may still be shown.
+    """
+
+    # Newest result slots kept pinned for the UI thread that may be drawing them
+    SHOWN_SLOTS = 3
+
+    def __init__(self, controller, camera_config=None, replay_source=None, realtime=None,
+                 model_path=None, backend=None):
+        self.config = PIPELINE_CONFIG
+        self.logger = logger
+        self.controller = controller
+        self.camera_config = {**TOP_CAMERA_CONFIG, **(camera_config or {})}
+        self.replay_source = replay_source
+        self.realtime = realtime
+        self.model_path = model_path or QRCODE_MODEL_PATH
+        self.backend = backend
+
+        self._ctx = mp.get_context('spawn')
+        self.ring: Optional[SharedFrameRing] = None
+        self.frames_processed = 0
+        self._result_seq = 0
+        self.detection_rate = 0.0
+        self._session = self._ctx.Value('l', 0)
+        self._counters = (self._ctx.Value('q', 0, lock=False), self._ctx.Value('q', 0, lock=False))
+        self._stop_event = self._ctx.Event()
+        self._processes = []
+        self._collector = None
+        self._shown = deque()
+        self._result_lock = threading.Lock()
+        self._latest_result: Optional[DetectionResult] = None
+        self.startup = get_startup_timer()
+
+    @property
+    def frames_captured(self) -> int:
+        return self._counters[0].value
+
+    @property
+    def frames_dropped(self) -> int:
+        """Frames discarded because detection was busy or every slot was pinned"""
+        return self._counters[1].value
+
+    def start(self):
+        """Create the frame ring and start the capture and detection processes"""
+        if self._processes:
+            return
+        slots = max(self.SHOWN_SLOTS + 3, int(self.config.get('ring_slots', 6)))
+        shape = (self.camera_config.get('height', 1080), self.camera_config.get('width', 1920), 3)
+        self.ring = SharedFrameRing(shape, slots, self._ctx.Lock())
+        self._stop_event.clear()
+
+        # Queues are kept referenced: a child unpickles their semaphores after start() returns
+        self._frame_queue = self._ctx.Queue(maxsize=max(1, int(self.config.get('frame_queue_size', 1))))
+        self._result_queue = self._ctx.Queue()
+        self._processes = [
+            self._ctx.Process(target=_capture_worker, name="TopCameraCapture", daemon=True,
+                              args=(self.ring.spec, self._frame_queue, self._stop_event, self._counters,
+                                    self.camera_config, self.replay_source, self.realtime)),
+            self._ctx.Process(target=_detect_worker, name="TopCameraDetect", daemon=True,
+                              args=(self.ring.spec, self._frame_queue, self._result_queue, self._stop_event,
+                                    self._session, self.model_path, self.backend))
+        ]
+        for p in self._processes:
+            p.start()
+        self._collector = threading.Thread(target=self._collect_loop, name="TopCameraResults", daemon=True)
+        self._collector.start()
+        self.logger.info(f"Detection processes started ({slots} shared frame slots of {shape[1]}x{shape[0]})")
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the worker processes and free the frame ring"""
+        self._stop_event.set()
+        if self._collector is not None:
+            self._collector.join(timeout)
+            self._collector = None
+        for p in self._processes:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        self._processes = []
+        with self._result_lock:
+            self._latest_result = None
+        self._shown.clear()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+        self.logger.info(f"Detection processes stopped ({self.frames_processed} frames processed, "
+                         f"{self.frames_dropped} dropped)")
+
+    def get_latest(self) -> Optional[DetectionResult]:
+        """Return the newest result (frame is a shared-memory view), or None before the first"""
+        with self._result_lock:
+            return self._latest_result
+
+    def _collect_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            kind = message[0]
+            if kind == 'ready':
+                self.startup.mark('model_loaded')
+                self.controller.attach_detector(_RemoteTracking(self._session))
+            elif kind == 'error':
+                self.logger.error(message[1])
+            else:
+                try:
+                    self._apply(*message[1:])
+                except Exception as e:
+                    self.logger.error(f"Detection pipeline error: {e}")
+
+    def _apply(self, seq, slot, session, ids, overlays, detected, skipped, rate):
+        # The slot arrives pinned by the detection process; it is released here
+        # unless it is handed to _shown, or its pin would leak and starve capture
+        shown = False
+        try:
+            # IDs decoded before a session reset belong to the closed pallet
+            count = self.controller.record_ids(ids if session == self._session.value else [])
+            captured_at = self.ring.stamp(slot)
+            if not skipped:
+                get_metrics().observe('frame_end_to_end', time.monotonic() - captured_at)
+                self.frames_processed += 1
+
+            self.detection_rate = rate
+            self.startup.mark('first_frame')
+            if detected:
+                self.startup.mark('first_detection')
+            with self._result_lock:
+                self._result_seq += 1
+                self._latest_result = DetectionResult(self._result_seq, self.ring.view(slot), count, False,
+                                                      overlays, captured_at)
+            self._shown.append(slot)
+            shown = True
+        finally:
+            if not shown and self.ring is not None:
+                self.ring.release(slot)
+
+        # Unpin frames that can no longer be shown
+        while len(self._shown) > self.SHOWN_SLOTS:
+            self.ring.release(self._shown.popleft())
@@ -0,0 +1,129 @@
+# multi_camera.py - Several cameras sharing one detection model
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from config import DETECTION_CONFIG, MULTI_CAMERA_CONFIG, OUTBOX_CONFIG, QRCODE_MODEL_PATH, logger
+from camera import TopCameraManager
+from detector import KegDetector, BatchedDetector
+from database import get_database
+from api_sender import get_api_client
+from outbox import DispatchOutbox
+from pallet_controller import CustomPalletController
+from pipeline import DetectionPipeline
+
+
+class CameraStation:
+    """One camera with its own pallet session, controller and capture -> detect pipeline"""
+
+    def __init__(self, name: str, camera: TopCameraManager, controller: CustomPalletController):
+        self.name = name
+        self.camera = camera
+        self.controller = controller
+        self.pipeline = DetectionPipeline(camera, controller)
+
+    def start(self):
+        self.camera.start()
+        self.pipeline.start()
+
+    def stop(self):
+        self.pipeline.stop()
+        self.camera.stop()
+
+
+class MultiCameraSystem:
+    """
+    Runs one CameraStation per entry in MULTI_CAMERA_CONFIG['cameras'].
+    All stations feed a single KegDetector through a BatchedDetector that
+    fills each model batch round-robin across cameras, so memory stays at
+    one model and no camera can starve the others. The DB connection, API
+    client and dispatch outbox are shared as well.
+    """
+
+    def __init__(self, camera_configs: Optional[List[Dict[str, Any]]] = None, detector: Optional[KegDetector] = None):
+        self.config = MULTI_CAMERA_CONFIG
+        self.logger = logger
+        camera_configs = camera_configs or self.config.get('cameras') or [{}]
+
+        self.detector = detector or KegDetector(model_path=QRCODE_MODEL_PATH)
+        # A batch never needs more than one frame per camera
+        batch_size = min(len(camera_configs), DETECTION_CONFIG.get('batch_size', 4))
+        self.engine = BatchedDetector(self.detector, batch_size=batch_size)
+
+        self.db = get_database()
+        self.api_client = get_api_client()
+        self.outbox = DispatchOutbox(self.api_client, self.db) if OUTBOX_CONFIG.get('enabled', True) else None
+
+        self.stations: List[CameraStation] = []
+        for i, camera_config in enumerate(camera_configs):
+            name = camera_config.get('name') or f"camera{i}"
+            camera = TopCameraManager(camera_config={**camera_config, 'name': name})
+            controller = CustomPalletController(
+                detector=self.engine.for_source(name),
+                db=self.db,
+                api_client=self.api_client,
+                outbox=self.outbox,
+                station=name
+            )
+            self.stations.append(CameraStation(name, camera, controller))
+
+        self._stats_stop = threading.Event()
+        self._stats_thread = None
+        self._last_stats = {}
+        self.logger.info(f"Multi-camera system: {len(self.stations)} cameras sharing one model")
+
+    def station(self, name: str) -> Optional[CameraStation]:
+        return next((s for s in self.stations if s.name == name), None)
+
+    def start(self):
+        if self.outbox is not None:
+            self.outbox.start()
+        self.engine.start()
+        for station in self.stations:
+            station.start()
+
+        interval = self.config.get('stats_interval', 10.0)
+        if interval and self._stats_thread is None:
+            self._stats_stop.clear()
+            self._stats_thread = threading.Thread(target=self._stats_loop, args=(interval,),
+                                                  name="MultiCameraStats", daemon=True)
+            self._stats_thread.start()
+
+    def stop(self):
+        self._stats_stop.set()
+        if self._stats_thread is not None:
+            self._stats_thread.join(timeout=2.0)
+            self._stats_thread = None
+        for station in self.stations:
+            station.stop()
+        self.engine.stop()
+        if self.outbox is not None:
+            self.outbox.stop()
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per camera: capture_fps and detect_fps since the previous call,
+        queue_depth (frames waiting for the pipeline plus for the shared model)
+        and stale frames dropped so far.
+        """
+        now = time.monotonic()
+        stats = {}
+        for station in self.stations:
+            captured = station.camera.frames_captured or station.camera.frame_count
+            processed = station.pipeline.frames_processed
+            last_time, last_captured, last_processed = self._last_stats.get(station.name, (None, 0, 0))
+            elapsed = now - last_time if last_time is not None else 0
+            stats[station.name] = {
+                'capture_fps': (captured - last_captured) / elapsed if elapsed else 0.0,
+                'detect_fps': (processed - last_processed) / elapsed if elapsed else 0.0,
+                'queue_depth': station.pipeline.frame_queue.qsize() + self.engine.queue_depth(station.name),
+                'frames_dropped': station.pipeline.frame_queue.dropped + station.camera.frames_dropped
+            }
+            self._last_stats[station.name] = (now, captured, processed)
+        return stats
+
+    def _stats_loop(self, interval: float):
+        self.get_stats()
+        while not self._stats_stop.wait(interval):
+            for name, s in self.get_stats().items():
+                self.logger.info(f"Camera {name}: capture {s['capture_fps']:.1f} fps, detect {s['detect_fps']:.1f} fps, "
+                                 f"queue {s['queue_depth']}, dropped {s['frames_dropped']}")
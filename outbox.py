@@ -0,0 +1,201 @@
+# outbox.py - Durable background dispatch of pallets to the cloud
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+from config import OUTBOX_CONFIG, logger
+
+
+class DispatchOutbox:
+    """
+    Sends queued pallet dispatches from the SQLite outbox on worker threads.
+    Entries survive restarts; transient failures are retried with jittered
+    exponential backoff. Every attempt carries the same Idempotency-Key.
+    A send that may have reached the server (read timeout, 5xx, restart
+    mid-send) is only retried when the server dedupes on that key
+    (server_dedupes); otherwise it is held as 'review' for an operator, since
+    a blind resend could create the dispatch twice; the HMI asks the operator
+    to resend it or mark it as arrived (resolve_review). Listeners are called
+    (from a worker thread) with a dict: outbox_id, pallet_id, status
+    ('sent' / 'retrying' / 'failed' / 'review'), attempts, error.
+    """
+
+    def __init__(self, api_client, db):
+        self.config = OUTBOX_CONFIG
+        self.logger = logger
+        self.api_client = api_client
+        self.db = db
+
+        self.max_concurrency = max(1, int(self.config.get('max_concurrency', 2)))
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._in_flight = set()
+        self._futures = set()
+        self._in_flight_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._pool = None
+        self._thread = None
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # A dispatch left mid-send may already exist on the server
+        dedupes = self.config.get('server_dedupes', False)
+        interrupted = self.db.recover_interrupted_dispatches('pending' if dedupes else 'review')
+        if interrupted and dedupes:
+            self.logger.info(f"Outbox: resuming {len(interrupted)} interrupted dispatches")
+        elif interrupted:
+            for pallet_id in interrupted:
+                self.db.update_pallet_status(pallet_id, "dispatch_unconfirmed")
+            self.logger.warning(f"Outbox: {len(interrupted)} dispatches were interrupted mid-send and are "
+                                f"held for review: {', '.join(interrupted)}")
+
+        self._stop_event.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="Dispatch")
+        self._thread = threading.Thread(target=self._run, name="DispatchOutbox", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Dispatch outbox started ({self.db.count_pending_dispatches()} pending)")
+
+    def stop(self):
+        """
+        Stop claiming work and wait (up to stop_timeout) for sends in flight,
+        so they are recorded before the database closes. A send still running
+        after that is recovered on the next start.
+        """
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._pool is not None:
+            with self._in_flight_lock:
+                futures = list(self._futures)
+            _, not_done = wait(futures, timeout=self.config.get('stop_timeout', 10.0))
+            if not_done:
+                self.logger.warning(f"Outbox: {len(not_done)} dispatches still in flight at shutdown")
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def enqueue(self, pallet_id: str, keg_ids: List[str], customer_id: str, area_name: str) -> Optional[int]:
+        """Persist a dispatch and wake the worker; returns immediately"""
+        outbox_id = self.db.enqueue_dispatch(pallet_id, {
+            'keg_ids': keg_ids,
+            'customer_id': customer_id,
+            'area_name': area_name
+        })
+        self._wake.set()
+        return outbox_id
+
+    def get_reviews(self) -> List[Dict[str, Any]]:
+        """Dispatches waiting for an operator decision (see resolve_review)"""
+        return self.db.get_review_dispatches()
+
+    def resolve_review(self, outbox_id: int, resend: bool) -> bool:
+        """Operator decision for a dispatch held for review (resend=False: it did reach the cloud)"""
+        pallet_id = self.db.resolve_dispatch_review(outbox_id, resend)
+        if pallet_id is None:
+            return False
+        if resend:
+            self.db.update_pallet_status(pallet_id, "pending_dispatch")
+            self._wake.set()
+        else:
+            self.db.update_pallet_status(pallet_id, "dispatched")
+        self.logger.info(f"Outbox: pallet {pallet_id} review resolved ({'resend' if resend else 'arrived'})")
+        return True
+
+    def _idempotency_key(self, job: Dict[str, Any]) -> str:
+        # Stable across attempts and restarts, unique across devices
+        return f"{self.api_client.mac_id}-{job['pallet_id']}-{job['id']}"
+
+    def _run(self):
+        poll_interval = self.config.get('poll_interval', 1.0)
+        while not self._stop_event.is_set():
+            with self._in_flight_lock:
+                free = self.max_concurrency - len(self._in_flight)
+
+            if free > 0:
+                for job in self.db.claim_due_dispatches(time.time(), free):
+                    with self._in_flight_lock:
+                        self._in_flight.add(job['id'])
+                        future = self._pool.submit(self._send, job)
+                        self._futures.add(future)
+                    future.add_done_callback(self._discard_future)
+
+            self._wake.wait(poll_interval)
+            self._wake.clear()
+
+    def _discard_future(self, future):
+        with self._in_flight_lock:
+            self._futures.discard(future)
+
+    def _retry_delay(self, attempts: int) -> float:
+        base = self.config.get('retry_base', 5.0)
+        cap = self.config.get('retry_max', 300.0)
+        return min(cap, base * (2 ** (attempts - 1))) * random.uniform(0.5, 1.0)
+
+    def _send(self, job: Dict[str, Any]):
+        outbox_id, pallet_id = job['id'], job['pallet_id']
+        attempts = job['attempts'] + 1
+        payload = job['payload']
+
+        try:
+            response = self.api_client.send_keg_batch(
+                keg_ids=payload['keg_ids'],
+                customer_id=payload['customer_id'],
+                area_name=payload['area_name'],
+                idempotency_key=self._idempotency_key(job)
+            )
+        except Exception as e:
+            response = {'success': False, 'error': str(e), 'ambiguous': True}
+
+        try:
+            if response.get('success'):
+                self.db.finish_dispatch(outbox_id, 'sent', attempts)
+                self.db.update_pallet_status(pallet_id, "dispatched")
+                self.logger.info(f"Outbox: pallet {pallet_id} dispatched ({len(payload['keg_ids'])} kegs)")
+                status, error = 'sent', None
+            else:
+                error = str(response.get('error'))
+                status_code = response.get('status_code')
+                # Client errors (other than timeout / rate limit) will not succeed on retry
+                permanent = status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+                max_attempts = self.config.get('max_attempts')
+                unconfirmed = response.get('ambiguous') and not self.config.get('server_dedupes', False)
+
+                if unconfirmed:
+                    self.db.finish_dispatch(outbox_id, 'review', attempts, error)
+                    self.db.update_pallet_status(pallet_id, "dispatch_unconfirmed")
+                    self.logger.error(f"Outbox: pallet {pallet_id} may have reached the server ({error}); "
+                                      f"held for review instead of resending")
+                    status = 'review'
+                elif permanent or (max_attempts and attempts >= max_attempts):
+                    self.db.finish_dispatch(outbox_id, 'failed', attempts, error)
+                    self.db.update_pallet_status(pallet_id, "error_dispatch")
+                    self.logger.error(f"Outbox: pallet {pallet_id} failed after {attempts} attempts: {error}")
+                    status = 'failed'
+                else:
+                    delay = self._retry_delay(attempts)
+                    self.db.finish_dispatch(outbox_id, 'pending', attempts, error, time.time() + delay)
+                    self.logger.warning(f"Outbox: pallet {pallet_id} attempt {attempts} failed, retrying in {delay:.0f}s")
+                    status = 'retrying'
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(outbox_id)
+            self._wake.set()
+
+        event = {
+            'outbox_id': outbox_id,
+            'pallet_id': pallet_id,
+            'status': status,
+            'attempts': attempts,
+            'error': error
+        }
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                self.logger.error(f"Outbox listener error: {e}")
@@ -1,20 +1,38 @@
 # pallet_controller.py
 import logging
+import threading
+import bisect
+import hashlib
+import json
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, Tuple, Callable, Optional
 from api_sender import get_api_client
 from detector import KegDetector
 from database import get_database
-from config import logger, QRCODE_MODEL_PATH
+from outbox import DispatchOutbox
+from metrics import get_metrics
+from config import logger, QRCODE_MODEL_PATH, OUTBOX_CONFIG, CUSTOMER_CACHE_CONFIG
 
 class CustomPalletController:
-    def __init__(self):
+    def __init__(self, detector=None, db=None, api_client=None, load_detector=True, outbox=None, station=None):
         self.logger = logger
-        self.api_client = get_api_client()
-        self.db = get_database()
+        # Camera name when several cameras run their own sessions; keeps pallet IDs unique
+        self.station = station
+        self.api_client = api_client or get_api_client()
+        self.db = db or get_database()
         
-        # Initialize Detector
-        self.detector = KegDetector(model_path=QRCODE_MODEL_PATH)
+        # Initialize Detector (load_detector=False defers it to attach_detector() during staged startup)
+        self.detector = detector
+        if self.detector is None and load_detector:
+            self.detector = KegDetector(model_path=QRCODE_MODEL_PATH)
+        
+        # Cloud dispatches go through a durable outbox so submit never blocks the UI
+        # (several camera controllers share one outbox; its owner starts it)
+        self.outbox = outbox
+        if self.outbox is None and OUTBOX_CONFIG.get('enabled', True):
+            self.outbox = DispatchOutbox(self.api_client, self.db)
+            self.outbox.start()
         
         # State variables
         # self.target_count = 0  # Removed
@@ -24,20 +42,102 @@ class CustomPalletController:
         # Using a set to ensure unique IDs
         self.scanned_kegs: Set[str] = set()
         self.saved_kegs: Set[str] = set() # To track what has been committed to DB
+        # Newly seen IDs not yet handed to the DB, flushed in bulk
+        self._pending_writes: List[str] = []
+        
+        # Sorted view of scanned_kegs kept up to date on insert; version bumps on every change
+        self._sorted_kegs: List[str] = []
+        self.scanned_version = 0
+        # Bumped by reset_session; detections started in an older session are not recorded
+        self.session_id = 0
+        
+        # process_frame runs on the detection worker, the rest on the UI thread
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
         
         # Start the first session immediately
         self.reset_session()
 
+    def attach_detector(self, detector):
+        """Install a detector loaded in the background; frames before this are passed through"""
+        with self._lock:
+            self.detector = detector
+            self.detector.reset_tracking()
+        self.logger.info("Detector attached to controller")
+
     def get_customers(self) -> List[Dict[str, str]]:
         return self.api_client.fetch_customers()
+
+    def get_cached_customers(self) -> Tuple[List[Dict[str, str]], bool]:
+        """Customers from the local cache, and whether they are still within the TTL"""
+        cache = self.db.get_customer_cache(self.api_client.mac_id)
+        if not cache:
+            return [], False
+        age = time.time() - (cache.get('fetched_at') or 0)
+        return cache['customers'], age < CUSTOMER_CACHE_CONFIG.get('ttl', 900)
+
+    def refresh_customers_async(self, callback: Callable[[Optional[List[Dict[str, str]]], bool], None]) -> bool:
+        """
+        Revalidate the customer list on a background thread.
+        callback(customers, changed) is called from that thread; customers is None on failure.
+        Returns False if a refresh is already running.
+        """
+        with self._refresh_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._refresh_customers, args=(callback,), name="CustomerRefresh", daemon=True).start()
+        return True
+
+    @staticmethod
+    def _customers_hash(customers: List[Dict[str, str]]) -> str:
+        canonical = json.dumps(sorted(customers, key=lambda c: (c['name'], c['id'])), sort_keys=True)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _refresh_customers(self, callback):
+        customers, changed = None, False
+        try:
+            key = self.api_client.mac_id
+            cache = self.db.get_customer_cache(key) or {}
+            result = self.api_client.fetch_customers_conditional(cache.get('etag'), cache.get('last_modified'))
+            now = time.time()
+            
+            if result['status'] == 'not_modified' and cache:
+                customers = cache['customers']
+                self.db.touch_customer_cache(key, now)
+            elif result['status'] == 'ok' and result['customers']:
+                customers = result['customers']
+                # Servers without ETag support still avoid a spinner rebuild when nothing changed
+                digest = self._customers_hash(customers)
+                changed = digest != cache.get('content_hash')
+                self.db.save_customer_cache(key, customers, digest, result['etag'], result['last_modified'], now)
+        except Exception as e:
+            self.logger.error(f"Customer refresh failed: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+        
+        callback(customers, changed)
     
     def reset_session(self):
         """Clears current data and starts a new pallet record"""
-        self.scanned_kegs.clear()
-        self.saved_kegs.clear()
-        
-        # Generate new Pallet ID
-        self.current_pallet_id = f"PAL_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        with self._lock:
+            # Pending kegs belong to the pallet being closed
+            if self.current_pallet_id:
+                self.save_locally()
+            self.session_id += 1
+            self._pending_writes.clear()
+            self.scanned_kegs.clear()
+            self.saved_kegs.clear()
+            self._sorted_kegs.clear()
+            self.scanned_version += 1
+            if self.detector is not None:
+                self.detector.reset_tracking()
+            
+            # Generate new Pallet ID
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            self.current_pallet_id = f"PAL_{self.station}_{stamp}" if self.station else f"PAL_{stamp}"
         self.logger.info(f"Session Reset. New Pallet ID: {self.current_pallet_id}")
 
         # Create initial record in DB
@@ -59,49 +159,87 @@ class CustomPalletController:
             )
 
     def process_frame(self, frame):
+        annotated_frame, current_count, reached, _ = self.process_frame_with_overlays(frame)
+        return annotated_frame, current_count, reached
+
+    def process_frame_with_overlays(self, frame):
+        """process_frame plus the BoxOverlay list the display should draw (empty if already drawn)"""
         # If target is 0 (not set), return raw frame and 0 count.
         # This stops detection and counting when system is idle.
         # if self.target_count <= 0:
         #     return frame, 0, False
 
-        # If target is set, proceed with detection
-        annotated_frame, new_ids = self.detector.detect_and_decode(frame)
+        detector = self.detector
+        if detector is None:
+            # Model still loading
+            return frame, len(self.scanned_kegs), False, []
         
-        for kid in new_ids:
-            # Only add if not already in our session list
-            if kid not in self.scanned_kegs:
-                self.scanned_kegs.add(kid)
-                self.logger.info(f"New Keg Detected: {kid} - Auto-saving...")
-                self.save_locally()
-                
-        current_count = len(self.scanned_kegs)
+        # If target is set, proceed with detection
+        session_id = self.session_id
+        annotated_frame, new_ids, overlays = detector.detect_with_overlays(frame)
+        current_count = self.record_ids(new_ids, session_id)
         # is_target_reached = (current_count >= self.target_count)
             
-        return annotated_frame, current_count, False
+        return annotated_frame, current_count, False, overlays
+
+    def record_ids(self, new_ids, session_id: Optional[int] = None) -> int:
+        """
+        Add IDs decoded in one frame to the session (saving new ones); returns the keg count.
+        session_id is the session the frame was detected in: if reset_session ran
+        meanwhile, the IDs belong to the closed pallet and are dropped.
+        """
+        with self._lock:
+            if session_id is not None and session_id != self.session_id:
+                self.logger.debug(f"Dropped {len(new_ids)} IDs detected before the session reset")
+                new_ids = []
+            for kid in new_ids:
+                # Only add if not already in our session list
+                if kid not in self.scanned_kegs:
+                    self.scanned_kegs.add(kid)
+                    bisect.insort(self._sorted_kegs, kid)
+                    self.scanned_version += 1
+                    self._pending_writes.append(kid)
+                    self.logger.info(f"New Keg Detected: {kid} - Auto-saving...")
+            
+            # One bulk write per frame for all kegs first seen in it
+            if self._pending_writes:
+                self.save_locally()
+                    
+            return len(self.scanned_kegs)
 
     def get_scanned_list(self) -> List[str]:
         """Returns list of IDs for the UI to display"""
-        return sorted(list(self.scanned_kegs))
+        with self._lock:
+            return list(self._sorted_kegs)
+
+    def get_scanned_snapshot(self) -> Tuple[int, List[str]]:
+        """(version, sorted IDs) so the UI can skip work when nothing changed"""
+        with self._lock:
+            return self.scanned_version, list(self._sorted_kegs)
 
     def save_locally(self) -> int:
         """
         Manually triggered by the SAVE button.
         Saves pending kegs to the database.
         """
-        count_saved = 0
-        for kid in self.scanned_kegs:
-            if kid not in self.saved_kegs:
-                success = self.db.add_keg_entry(
+        with self._lock:
+            if not self._pending_writes:
+                return 0
+            
+            pending = self._pending_writes
+            with get_metrics().timer('db_add_keg_entries'):
+                success = self.db.add_keg_entries(
                     pallet_id=self.current_pallet_id,
-                    location="TopCamera",
-                    count=1,
-                    qr_codes=[kid]
+                    location=self.station or "TopCamera",
+                    qr_codes=pending
                 )
-                if success:
-                    self.saved_kegs.add(kid)
-                    count_saved += 1
-        
-        return count_saved
+            if not success:
+                # Keep them queued; the next save retries
+                return 0
+            
+            self.saved_kegs.update(pending)
+            self._pending_writes = []
+            return len(pending)
 
     def submit_batch(self, area_name: str):
         """Finalize and send to cloud"""
@@ -111,7 +249,19 @@ class CustomPalletController:
         if not self.selected_customer_id:
             return {'success': False, 'error': "No Customer Selected"}
             
-        keg_list = list(self.scanned_kegs)
+        with self._lock:
+            keg_list = list(self.scanned_kegs)
+            pallet_id = self.current_pallet_id
+        
+        if self.outbox is not None:
+            # Persist and return; the outbox worker sends it and reports back via listeners.
+            # Status is set first so the worker's "dispatched" can never be overwritten.
+            self.db.update_pallet_status(pallet_id, "pending_dispatch")
+            outbox_id = self.outbox.enqueue(pallet_id, keg_list, self.selected_customer_id, area_name)
+            if outbox_id is None:
+                self.db.update_pallet_status(pallet_id, "error_dispatch")
+                return {'success': False, 'error': "Failed to queue dispatch"}
+            return {'success': True, 'queued': True, 'outbox_id': outbox_id, 'pallet_id': pallet_id}
         
         # Send to Cloud with Area Name
         response = self.api_client.send_keg_batch(
@@ -122,9 +272,9 @@ class CustomPalletController:
         
         if response.get('success'):
             self.logger.info(f"Successfully dispatched {len(keg_list)} kegs.")
-            self.db.update_pallet_status(self.current_pallet_id, "dispatched")
+            self.db.update_pallet_status(pallet_id, "dispatched")
         else:
             self.logger.error(f"API Failed: {response.get('error')}")
-            self.db.update_pallet_status(self.current_pallet_id, "error_dispatch")
+            self.db.update_pallet_status(pallet_id, "error_dispatch")
             
         return response
\ No newline at end of file
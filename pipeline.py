@@ -0,0 +1,155 @@
+# pipeline.py - Background Capture -> Detect Pipeline
+import queue
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+from config import PIPELINE_CONFIG, logger
+from metrics import get_metrics
+from scheduler import DetectionScheduler
+from startup import get_startup_timer
+
+
+class DetectionResult(NamedTuple):
+    """Newest output of the detection worker, as consumed by the HMI"""
+    seq: int
+    frame: Any
+    count: int
+    reached: bool
+    overlays: tuple = ()  # BoxOverlay list to draw at display resolution (overlay_mode)
+    captured_at: float = 0.0  # time.monotonic() when the frame was captured
+
+
+class LatestFrameQueue:
+    """Bounded queue that drops the oldest frame instead of blocking the producer"""
+
+    def __init__(self, maxsize: int = 1):
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                # Discard the stale frame and try again
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def get(self, timeout: Optional[float] = None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DetectionPipeline:
+    """Runs camera capture and YOLO/QR detection off the Kivy UI thread"""
+
+    def __init__(self, top_camera, controller):
+        self.config = PIPELINE_CONFIG
+        self.logger = logger
+        self.top_camera = top_camera
+        self.controller = controller
+
+        self.frame_queue = LatestFrameQueue(self.config.get('frame_queue_size', 1))
+        self.frames_processed = 0
+        # Results published, including frames shown without detection (DetectionResult.seq)
+        self._result_seq = 0
+        self._last_overlays = ()
+        # Skips detection on unchanged scenes and paces it to the measured inference time
+        self.scheduler = DetectionScheduler()
+
+        self._result_lock = threading.Lock()
+        self._latest_result: Optional[DetectionResult] = None
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.startup = get_startup_timer()
+
+    def start(self):
+        """Start the capture and detection worker threads"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="TopCameraCapture", daemon=True),
+            threading.Thread(target=self._detect_loop, name="TopCameraDetect", daemon=True)
+        ]
+        for t in self._threads:
+            t.start()
+        self.logger.info("Detection pipeline started")
+
+    def stop(self, timeout: float = 2.0):
+        """Signal the workers to exit and wait for them"""
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.logger.info(f"Detection pipeline stopped ({self.frames_processed} frames processed, "
+                         f"{self.frame_queue.dropped} stale frames dropped, "
+                         f"{self.scheduler.frames_skipped} skipped as unchanged)")
+
+    @property
+    def detection_rate(self) -> float:
+        """Current effective detections per second"""
+        return self.scheduler.effective_rate
+
+    def get_latest(self) -> Optional[DetectionResult]:
+        """Return the newest annotated frame and count, or None before the first result"""
+        with self._result_lock:
+            return self._latest_result
+
+    def _capture_loop(self):
+        retry_delay = self.config.get('read_retry_delay', 0.01)
+        while not self._stop_event.is_set():
+            if not self.top_camera.is_active:
+                self._stop_event.wait(retry_delay)
+                continue
+
+            ret, frame = self.top_camera.get_overhead_view()
+            if not ret or frame is None:
+                self._stop_event.wait(retry_delay)
+                continue
+
+            self.startup.mark('first_frame')
+            self.frame_queue.put((frame, time.monotonic()))
+
+    def _detect_loop(self):
+        while not self._stop_event.is_set():
+            item = self.frame_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            frame, captured_at = item
+
+            # Until the model is attached frames pass straight through, so skip the scheduler
+            if self.controller.detector is not None and not self.scheduler.should_run(frame):
+                # Unchanged scene: keep the live view moving with the last boxes and count
+                self._publish(frame, len(self.controller.scanned_kegs), False, self._last_overlays, captured_at)
+                continue
+
+            start = time.perf_counter()
+            try:
+                processed, count, reached, overlays = self.controller.process_frame_with_overlays(frame)
+            except Exception as e:
+                self.logger.error(f"Detection pipeline error: {e}")
+                continue
+            finally:
+                self.scheduler.record_run(time.perf_counter() - start)
+
+            get_metrics().observe('frame_end_to_end', time.monotonic() - captured_at)
+            self.frames_processed += 1
+            if self.controller.detector is not None:
+                self.startup.mark('first_detection')
+            self._last_overlays = overlays
+            self._publish(processed, count, reached, overlays, captured_at)
+
+    def _publish(self, frame, count, reached, overlays, captured_at):
+        with self._result_lock:
+            self._result_seq += 1
+            self._latest_result = DetectionResult(self._result_seq, frame, count, reached, overlays, captured_at)
@@ -0,0 +1,261 @@
+# qr_decode.py - QR decoding of keg crops (serial, thread pool or process pool)
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode
+from config import DECODE_CONFIG, logger
+from metrics import get_metrics
+
+# cv2 helper objects are not thread-safe: one set per decode thread
+_local = threading.local()
+
+
+def _zbar(image) -> List[str]:
+    decoded = []
+    for obj in decode(image):
+        qr_data = obj.data.decode('utf-8')
+        if qr_data:
+            decoded.append(qr_data)
+    return decoded
+
+
+def _gray(crop):
+    return cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+
+
+def _strategy_gray(crop) -> List[str]:
+    return _zbar(_gray(crop))
+
+
+def _strategy_clahe(crop) -> List[str]:
+    # Local contrast equalisation pulls modules out of glare on the keg cap
+    clahe = getattr(_local, 'clahe', None)
+    if clahe is None:
+        clahe = _local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return _zbar(clahe.apply(_gray(crop)))
+
+
+def _strategy_adaptive(crop) -> List[str]:
+    binary = cv2.adaptiveThreshold(_gray(crop), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 5)
+    return _zbar(binary)
+
+
+def _strategy_upscale(crop) -> List[str]:
+    # Small or distant codes: give zbar two pixels per module
+    return _zbar(cv2.resize(_gray(crop), None, fx=2.0, fy=2.0, interpolation=cv2.INTER_CUBIC))
+
+
+def _strategy_opencv(crop) -> List[str]:
+    detector = getattr(_local, 'qr_detector', None)
+    if detector is None:
+        detector = _local.qr_detector = cv2.QRCodeDetector()
+    ok, texts, _, _ = detector.detectAndDecodeMulti(crop)
+    return [text for text in texts if text] if ok else []
+
+
+def _strategy_wechat(crop) -> List[str]:
+    # Only with opencv-contrib; without its CNN model files it still runs the classic detector
+    detector = getattr(_local, 'wechat', None)
+    if detector is None:
+        detector = _local.wechat = cv2.wechat_qrcode_WeChatQRCode()
+    texts, _ = detector.detectAndDecode(crop)
+    return [text for text in texts if text]
+
+
+STRATEGIES: Dict[str, Callable[[np.ndarray], List[str]]] = {
+    'gray': _strategy_gray,
+    'clahe': _strategy_clahe,
+    'adaptive': _strategy_adaptive,
+    'upscale': _strategy_upscale,
+    'opencv': _strategy_opencv,
+    'wechat': _strategy_wechat
+}
+
+
+class DecodeChain:
+    """
+    Ordered fallback of decode strategies for one crop. Strategies run until
+    one returns an ID or the per-crop time budget is used up (the first one
+    always runs). A strategy is skipped when its expected cost on this crop
+    (measured average cost per pixel times the crop size) would overrun what
+    is left of the budget, so a slow one (upscale, wechat) is not started just
+    before the budget ends. A strategy skipped probe_every times in a row is
+    run once anyway, so one slow sample cannot lock it out. With learn_order, strategies are
+    tried in order of how often they have succeeded so far, so the usual
+    winner on this camera goes first.
+    """
+
+    def __init__(self, names=None, budget_ms=None, learn_order=None):
+        self.logger = logger
+        names = names or DECODE_CONFIG.get('strategies') or ['gray']
+        if 'wechat' in names and not hasattr(cv2, 'wechat_qrcode_WeChatQRCode'):
+            names = [name for name in names if name != 'wechat']
+        unknown = [name for name in names if name not in STRATEGIES]
+        if unknown:
+            self.logger.warning(f"Unknown QR decode strategies ignored: {unknown}")
+        self.names = [name for name in names if name in STRATEGIES] or ['gray']
+        budget_ms = budget_ms if budget_ms is not None else DECODE_CONFIG.get('crop_budget_ms', 15)
+        self.budget = budget_ms / 1000.0
+        self.learn_order = DECODE_CONFIG.get('learn_order', True) if learn_order is None else learn_order
+        self.probe_every = max(1, int(DECODE_CONFIG.get('probe_every', 20)))
+        
+        self.successes = dict.fromkeys(self.names, 0)
+        self.order = list(self.names)
+        # Moving average of each strategy's run time per crop pixel (seconds), for the budget check
+        self.costs = dict.fromkeys(self.names, 0.0)
+        self._skips = dict.fromkeys(self.names, 0)
+        self._lock = threading.Lock()
+
+    def _record_success(self, name: str):
+        with self._lock:
+            self.successes[name] += 1
+            if self.learn_order:
+                # Stable sort: ties keep the configured order
+                self.order = sorted(self.names, key=lambda n: -self.successes[n])
+        get_metrics().increment(f"qr_strategy_{name}")
+
+    def _record_cost(self, name: str, seconds: float, pixels: int):
+        per_pixel = seconds / max(1, pixels)
+        with self._lock:
+            cost = self.costs[name]
+            self.costs[name] = per_pixel if cost == 0.0 else 0.8 * cost + 0.2 * per_pixel
+            self._skips[name] = 0
+
+    def _should_skip(self, name: str, remaining: float, pixels: int) -> bool:
+        """Budget check before starting a strategy; every probe_every-th skip runs it anyway"""
+        with self._lock:
+            if self.costs[name] * pixels <= remaining:
+                return False
+            self._skips[name] += 1
+            return self._skips[name] % self.probe_every != 0
+
+    def decode(self, crop, full: bool = True) -> List[str]:
+        """Try the strategies in order; full=False runs only the first (learned best) one"""
+        order = self.order if full else self.order[:1]
+        pixels = crop.shape[0] * crop.shape[1]
+        start = time.perf_counter()
+        skipped = False
+        for i, name in enumerate(order):
+            started = time.perf_counter()
+            if i and self._should_skip(name, self.budget - (started - start), pixels):
+                skipped = True
+                continue
+            try:
+                decoded = STRATEGIES[name](crop)
+            except Exception as e:
+                self.logger.debug(f"QR strategy {name} failed: {e}")
+                continue
+            finally:
+                self._record_cost(name, time.perf_counter() - started, pixels)
+            if decoded:
+                self._record_success(name)
+                return decoded
+        if skipped:
+            get_metrics().increment('qr_decode_budget_exhausted')
+        return []
+
+
+_chain = None
+
+def get_decode_chain() -> DecodeChain:
+    """Per-process chain (process-pool workers learn their own order)"""
+    global _chain
+    if _chain is None:
+        _chain = DecodeChain()
+    return _chain
+
+
+def decode_crop(crop, full: bool = True) -> List[str]:
+    """Decode all QR payloads found in one crop (full=False: first strategy only)"""
+    if crop is None or crop.size == 0:
+        return []
+    return get_decode_chain().decode(crop, full)
+
+
+def _timed_decode_crop(crop, full: bool = True) -> List[str]:
+    with get_metrics().timer('qr_decode_crop'):
+        return decode_crop(crop, full)
+
+
+def _decode_shared_crop(shm_name: str, offset: int, shape: tuple, full: bool = True) -> List[str]:
+    """Process-pool worker: decode a crop that lives in a shared memory block"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    crop = None
+    try:
+        crop = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        return decode_crop(crop, full)
+    finally:
+        # Release the buffer export before closing the mapping
+        crop = None
+        shm.close()
+
+
+class DecodeExecutor:
+    """
+    Decodes all crops of a frame at once and gathers the IDs in input order.
+    Modes (DECODE_CONFIG['executor']):
+      serial  - decode in the calling thread
+      thread  - thread pool; pyzbar releases the GIL inside the zbar call
+      process - process pool; crops are packed into one shared memory block
+                per frame so pixel data is never pickled
+    """
+
+    def __init__(self, mode=None, pool_size=None):
+        self.logger = logger
+        self.mode = mode or DECODE_CONFIG.get('executor', 'serial')
+        self.pool_size = int(pool_size or DECODE_CONFIG.get('pool_size') or os.cpu_count() or 1)
+        self._pool = None
+
+        if self.mode == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="QRDecode")
+        elif self.mode == 'process':
+            self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+        elif self.mode != 'serial':
+            self.logger.warning(f"Unknown decode executor '{self.mode}', using serial decoding")
+            self.mode = 'serial'
+        self.logger.info(f"QR decode executor: {self.mode} (pool size {self.pool_size})")
+
+    def decode_all(self, crops: Sequence[np.ndarray], full: Optional[Sequence[bool]] = None) -> List[List[str]]:
+        """
+        Decode every crop; returns one list of IDs per crop, in order.
+        full gives per crop whether the whole fallback chain may run (default
+        all); otherwise only the first strategy is tried.
+        """
+        if not crops:
+            return []
+        full = list(full) if full is not None else [True] * len(crops)
+        with get_metrics().timer('qr_decode_frame'):
+            if self.mode == 'serial' or len(crops) == 1:
+                return [_timed_decode_crop(crop, f) for crop, f in zip(crops, full)]
+            if self.mode == 'thread':
+                return list(self._pool.map(_timed_decode_crop, crops, full))
+            # Worker processes have their own registry, so only the frame total is timed here
+            return self._decode_shared(crops, full)
+
+    def _decode_shared(self, crops, full) -> List[List[str]]:
+        crops = [np.ascontiguousarray(crop, dtype=np.uint8) for crop in crops]
+        total = sum(crop.nbytes for crop in crops)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+        try:
+            futures = []
+            offset = 0
+            for crop, f in zip(crops, full):
+                view = np.ndarray(crop.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+                view[...] = crop
+                del view
+                futures.append(self._pool.submit(_decode_shared_crop, shm.name, offset, crop.shape, f))
+                offset += crop.nbytes
+            return [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
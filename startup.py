@@ -0,0 +1,58 @@
+# startup.py - Boot milestone timing (time-to-first-frame / time-to-first-detection)
+import threading
+import time
+from typing import Dict, Optional
+from config import logger
+
+# Imported first thing by main.py, so this approximates process start
+_PROCESS_ORIGIN = time.monotonic()
+
+
+class StartupTimer:
+    """Records the first time each named boot milestone is reached, relative to process start"""
+
+    # Milestone that completes the boot sequence and triggers the report
+    FINAL_MILESTONE = 'first_detection_shown'
+
+    def __init__(self, origin: Optional[float] = None):
+        self.logger = logger
+        self.origin = _PROCESS_ORIGIN if origin is None else origin
+        self._marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.reported = False
+
+    def mark(self, name: str):
+        """Record a milestone; later calls with the same name are ignored (cheap on hot paths)"""
+        if name in self._marks:
+            return
+        with self._lock:
+            if name in self._marks:
+                return
+            self._marks[name] = time.monotonic() - self.origin
+        self.logger.info(f"Startup: {name} at {self._marks[name]:.2f}s")
+        if name == self.FINAL_MILESTONE:
+            self.log_report()
+
+    def elapsed(self, name: str) -> Optional[float]:
+        """Seconds from process start to the milestone, or None if not reached yet"""
+        return self._marks.get(name)
+
+    def report(self) -> Dict[str, float]:
+        """All milestones reached so far, in the order they happened"""
+        with self._lock:
+            return dict(sorted(self._marks.items(), key=lambda item: item[1]))
+
+    def log_report(self):
+        self.reported = True
+        lines = [f"  {name:<22} {seconds:7.2f}s" for name, seconds in self.report().items()]
+        self.logger.info("Startup timing report:\n" + "\n".join(lines))
+
+
+# Singleton instance
+_startup_instance = None
+
+def get_startup_timer() -> StartupTimer:
+    global _startup_instance
+    if _startup_instance is None:
+        _startup_instance = StartupTimer()
+    return _startup_instance
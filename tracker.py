@@ -0,0 +1,151 @@
+# tracker.py - Lightweight IoU box tracker for keg detections
+from collections import deque
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+
+class Track:
+    """A keg box followed across frames, with the QR ID confirmed for it (if any)"""
+    __slots__ = ('track_id', 'box', 'qr_id', 'last_decode_frame', 'misses', 'votes')
+
+    def __init__(self, track_id: int, box):
+        self.track_id = track_id
+        self.box = box
+        self.qr_id: Optional[str] = None
+        self.last_decode_frame = -1
+        self.misses = 0
+        self.votes = None  # deque of recent (time, decoded ID), created on the first decode
+
+    def vote(self, qr_id: str, now: float, window: float, min_agree: int, max_votes: int) -> Tuple[bool, int]:
+        """
+        Record one decode at time `now`. Returns (agreed, rejected): agreed is
+        True once qr_id has min_agree votes among the last max_votes decodes of
+        this track that are at most `window` seconds old. rejected counts votes
+        dropped as misreads: ones that expire or fall out of the buffer without
+        matching the track's confirmed ID, and, when qr_id is confirmed, the
+        minority votes it beat.
+        """
+        if self.votes is None:
+            self.votes = deque(maxlen=max(min_agree, max_votes))
+        votes = self.votes
+        rejected = 0
+        while votes and now - votes[0][0] > window:
+            rejected += votes.popleft()[1] != self.qr_id
+        if len(votes) == votes.maxlen:
+            rejected += votes[0][1] != self.qr_id
+        votes.append((now, qr_id))
+
+        agreed = sum(1 for _, voted in votes if voted == qr_id) >= min_agree
+        if agreed and qr_id != self.qr_id:
+            # The winner is about to be confirmed: the other reads lost (votes for
+            # the previously confirmed ID were right at the time and are not counted)
+            rejected += sum(1 for _, voted in votes if voted not in (qr_id, self.qr_id))
+            self.votes = deque((vote for vote in votes if vote[1] == qr_id), maxlen=votes.maxlen)
+        return agreed, rejected
+
+    def drop_votes(self) -> int:
+        """Clear the buffer when the track is dropped; returns the votes that never matched its ID"""
+        if not self.votes:
+            return 0
+        rejected = sum(1 for _, voted in self.votes if voted != self.qr_id)
+        self.votes = None
+        return rejected
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two (N, 4) / (M, 4) arrays of x1, y1, x2, y2 boxes"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+
+    a = boxes_a[:, None, :].astype(np.float32)
+    b = boxes_b[None, :, :].astype(np.float32)
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class BoxTracker:
+    """
+    Greedy IoU association of YOLO boxes across consecutive frames.
+    update() runs on the detection thread only; other threads call
+    request_reset(), which update() applies before its next frame.
+    """
+
+    def __init__(self, iou_threshold: float = 0.5, max_misses: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks: List[Track] = []
+        self.frame_index = 0
+        self._next_id = 1
+        # Tracks dropped by the last update() (unmatched for more than max_misses frames)
+        self.dropped: List[Track] = []
+        # Reset requests from other threads, and how many update() has applied
+        self._reset_requests = 0
+        self._resets_applied = 0
+
+    def reset(self):
+        """Forget all tracks at once; only from the thread that calls update()"""
+        self.tracks = []
+        self.dropped = []
+        self.frame_index = 0
+
+    def request_reset(self):
+        """Thread-safe reset: the tracks are dropped at the start of the next update()"""
+        self._reset_requests += 1
+
+    def update(self, boxes: Sequence[Sequence[int]]) -> List[Track]:
+        """
+        Match this frame's boxes to existing tracks.
+        Returns one Track per input box, in the same order.
+        """
+        requests = self._reset_requests
+        if requests != self._resets_applied:
+            self._resets_applied = requests
+            self.reset()
+        self.frame_index += 1
+        boxes_arr = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        track_boxes = np.asarray([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        ious = iou_matrix(boxes_arr, track_boxes)
+
+        assigned: List[Optional[Track]] = [None] * len(boxes_arr)
+        matched_tracks = set()
+        if ious.size:
+            # Best overlaps first; each box and each track is used at most once
+            for flat in np.argsort(-ious, axis=None):
+                bi, ti = divmod(int(flat), ious.shape[1])
+                if ious[bi, ti] < self.iou_threshold:
+                    break
+                if assigned[bi] is not None or ti in matched_tracks:
+                    continue
+                assigned[bi] = self.tracks[ti]
+                matched_tracks.add(ti)
+
+        survivors = []
+        self.dropped = []
+        for ti, track in enumerate(self.tracks):
+            if ti in matched_tracks:
+                track.misses = 0
+                survivors.append(track)
+            else:
+                track.misses += 1
+                if track.misses <= self.max_misses:
+                    survivors.append(track)
+                else:
+                    self.dropped.append(track)
+
+        for bi, box in enumerate(boxes):
+            track = assigned[bi]
+            if track is None:
+                track = Track(self._next_id, tuple(box))
+                self._next_id += 1
+                survivors.append(track)
+                assigned[bi] = track
+            else:
+                track.box = tuple(box)
+
+        self.tracks = survivors
+        return assigned
@@ -1,73 +1,116 @@
 # ws_client.py
 import socketio
 import json
+import random
 import threading
 import time
+from collections import deque
 from typing import Callable, Optional, Dict, Any
 from config import WEBSOCKET_CONFIG, SYSTEM_CONFIG, logger
 
 class CloudWebSocket:
+    """
+    Socket.IO link to the cloud.
+    A supervisor thread owns the connection: it dials, sleeps until the link
+    drops (disconnect event or missed heartbeats), then re-dials with jittered
+    exponential backoff. Incoming messages and status changes are queued and
+    handed to the callbacks only by dispatch_pending(), which the app calls
+    from the UI thread.
+    """
+
     def __init__(self, on_response: Callable[[Dict[str, Any]], None], on_connection_change: Optional[Callable[[str], None]] = None):
         self.config = WEBSOCKET_CONFIG
         self.mac_id = SYSTEM_CONFIG['mac_id']
         self.forklift_id = SYSTEM_CONFIG['forklift_id']
-        
-        # Initialize SocketIO
-        self.sio = socketio.Client(logger=False, engineio_logger=False)
+
+        # Reconnection is driven by the supervisor thread, not by socketio's own loop
+        self.sio = socketio.Client(reconnection=False, logger=False, engineio_logger=False)
         self.url = self.config['url']
         self.on_response = on_response
         self.on_connection_change = on_connection_change
         self.is_connected = False
-        
+
+        # Bounded hand-off to the UI thread: ('message', data) or ('status', text)
+        self._events = deque(maxlen=max(1, int(self.config.get('message_queue_size', 100))))
+        self.messages_dropped = 0
+        self._last_status = None
+        self._disconnected = threading.Event()
+        self._stop_event = threading.Event()
+        self._failed_attempts = 0
+
         self._setup_callbacks()
         self._start_connection_thread()
-    
+
     def _setup_callbacks(self):
         @self.sio.event
         def connect():
             logger.info(f"WebSocket: Connected to {self.url}")
             self.is_connected = True
-            if self.on_connection_change:
-                self.on_connection_change("connected")
-            
+            self._disconnected.clear()
+            self._queue_event('status', "connected")
+
             self._register()
-            
+
         @self.sio.event
-        def disconnect():
+        def disconnect(*args):
             logger.warning("WebSocket: Disconnected")
             self.is_connected = False
-            if self.on_connection_change:
-                self.on_connection_change("disconnected")
-        
+            self._disconnected.set()
+            self._queue_event('status', "disconnected")
+
         @self.sio.event
         def connect_error(data):
             # logger.error(f"WebSocket Connection error: {data}")
             self.is_connected = False
-            if self.on_connection_change:
-                self.on_connection_change("disconnected")
+            self._disconnected.set()
 
         @self.sio.on('message')
         def on_message(data):
             logger.debug(f"WebSocket msg: {data}")
             self._process_message(data)
-            
+
         # Listen to personal channel (MAC address) - CRITICAL FOR POPUPS
         @self.sio.on(self.mac_id)
         def on_personal_message(data):
             logger.info(f"WebSocket Personal Msg: {data}")
             self._process_message(data)
 
+    def _queue_event(self, kind: str, payload):
+        if kind == 'status':
+            if payload == self._last_status:
+                return
+            self._last_status = payload
+        if len(self._events) == self._events.maxlen:
+            self.messages_dropped += 1
+        self._events.append((kind, payload))
+
     def _process_message(self, data):
-        """Normalize data and send to UI"""
+        """Normalize data and queue it for the UI"""
         # If server sends just a string like "Storage Area", wrap it
         if isinstance(data, str):
-            normalized = {
+            data = {
                 "type": "location_update",
                 "location": data
             }
-            self.on_response(normalized)
-        else:
-            self.on_response(data)
+        self._queue_event('message', data)
+
+    def dispatch_pending(self, dt=None, max_items: int = 50) -> int:
+        """Deliver queued messages and status changes; call from the UI thread"""
+        delivered = 0
+        while delivered < max_items:
+            try:
+                kind, payload = self._events.popleft()
+            except IndexError:
+                break
+            delivered += 1
+            try:
+                if kind == 'message':
+                    self.on_response(payload)
+                elif self.on_connection_change:
+                    self.on_connection_change(payload)
+            except Exception as e:
+                logger.error(f"WebSocket callback error: {e}")
+        return delivered
 
     def _register(self):
         """Tell the server who we are so it can send us popups"""
@@ -81,23 +124,81 @@ class CloudWebSocket:
         self.sio.send(register_payload)
         logger.info(f"WebSocket: Registered as {self.forklift_id}")
 
+    def _reconnect_delay(self) -> float:
+        """Exponential backoff from reconnection_delay, jittered so devices do not re-dial in lockstep"""
+        base = self.config.get('reconnection_delay', 5)
+        cap = self.config.get('reconnection_delay_max', 120)
+        return min(cap, base * (2 ** self._failed_attempts)) * random.uniform(0.5, 1.0)
+
+    def _heartbeat_ok(self) -> bool:
+        """Liveness check while connected: an acked event if configured, else the engine.io state"""
+        if not self.sio.connected:
+            return False
+        event = self.config.get('heartbeat_event')
+        if not event:
+            return True
+        try:
+            self.sio.call(event, {"mac_id": self.mac_id}, timeout=self.config.get('heartbeat_timeout', 5))
+            return True
+        except socketio.exceptions.TimeoutError:
+            return False
+        except Exception as e:
+            logger.debug(f"WebSocket heartbeat error: {e}")
+            return False
+
+    def _supervise(self):
+        """Hold the connection open until stop(); returns when the link is lost"""
+        interval = self.config.get('heartbeat_interval', 15)
+        max_misses = self.config.get('heartbeat_max_misses', 2)
+        misses = 0
+        while not self._stop_event.is_set():
+            if self._disconnected.wait(interval):
+                return
+            if self._heartbeat_ok():
+                misses = 0
+                continue
+            misses += 1
+            logger.warning(f"WebSocket: heartbeat missed ({misses}/{max_misses})")
+            if misses >= max_misses:
+                # Half-open connection: drop it so the supervisor dials again
+                self.sio.disconnect()
+                return
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._queue_event('status', "connecting")
+            try:
+                self._disconnected.clear()
+                self.sio.connect(self.url, transports=['websocket'],
+                                 wait_timeout=self.config.get('connect_timeout', 5))
+                self._failed_attempts = 0
+                self._supervise()
+            except Exception as e:
+                logger.debug(f"WebSocket connect failed: {e}")
+
+            self.is_connected = False
+            try:
+                self.sio.disconnect()
+            except Exception:
+                pass
+            if self._stop_event.is_set():
+                break
+
+            self._queue_event('status', "disconnected")
+            delay = self._reconnect_delay()
+            self._failed_attempts += 1
+            logger.info(f"WebSocket: reconnecting in {delay:.1f}s")
+            self._stop_event.wait(delay)
+
     def _start_connection_thread(self):
-        def run():
-            while True:
-                if not self.is_connected:
-                    try:
-                        if self.on_connection_change:
-                            self.on_connection_change("connecting")
-                        self.sio.connect(self.url, transports=['websocket'], wait_timeout=5)
-                        self.sio.wait()
-                    except Exception as e:
-                        # logger.error(f"WS Connect Failed: {e}")
-                        if self.on_connection_change:
-                            self.on_connection_change("disconnected")
-                        self.sio.disconnect()
-                        time.sleep(5) # Reconnect delay
-                else:
-                    time.sleep(1)
-                    
-        t = threading.Thread(target=run, daemon=True)
-        t.start()
\ No newline at end of file
+        self._thread = threading.Thread(target=self._run, name="CloudWebSocket", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop reconnecting and close the connection"""
+        self._stop_event.set()
+        self._disconnected.set()
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass